@@ -1,35 +1,197 @@
 import numpy as np
 from datetime import datetime, timedelta
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import RandomForestRegressor
-from typing import Dict, List, Tuple, Optional
+from functools import cached_property
+from types import MappingProxyType
+from typing import Dict, List, Tuple, Optional, Union
+
+from services.recommendation import profile_inputs, recommend
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+class IntakeColumns:
+    """A water log parsed once into columnar arrays.
+
+    `days` is datetime64[D], `hours` the hour of day (0-23) and `amounts`
+    keeps the log's numeric type (int64 when every amount is an int).
+    """
+
+    def __init__(self, days: np.ndarray, hours: np.ndarray, amounts: np.ndarray,
+                 float_mask: Optional[np.ndarray] = None):
+        self.days = days
+        self.hours = hours
+        self.amounts = amounts
+        # For logs mixing ints and floats: which entries were floats, so
+        # days made only of int entries still total to an int
+        self.float_mask = float_mask
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    @classmethod
+    def from_log(cls, water_log: List[Dict]) -> 'IntakeColumns':
+        count = len(water_log)
+        ordinals = np.empty(count, dtype=np.int64)
+        hours = np.empty(count, dtype=np.int64)
+        for i, entry in enumerate(water_log):
+            timestamp = datetime.fromisoformat(entry['timestamp'])
+            ordinals[i] = timestamp.toordinal()
+            hours[i] = timestamp.hour
+        raw_amounts = [entry['amount'] for entry in water_log]
+        amounts = np.asarray(raw_amounts)
+        if amounts.dtype.kind not in 'iuf':
+            amounts = amounts.astype(np.float64)
+        float_mask = None
+        if amounts.dtype.kind == 'f':
+            float_mask = np.fromiter((isinstance(a, float) for a in raw_amounts), dtype=bool, count=count)
+            if float_mask.all():
+                float_mask = None
+        days = (ordinals - _EPOCH_ORDINAL).astype('datetime64[D]')
+        return cls(days, hours, amounts, float_mask)
+
+    def daily_totals(self) -> Dict:
+        """{date: total}, keyed in order of first appearance in the log."""
+        if not len(self.days):
+            return {}
+        unique_days, first_index, inverse = np.unique(
+            self.days, return_index=True, return_inverse=True
+        )
+        # bincount adds the weights in log order, matching a running sum per day
+        totals = np.bincount(inverse.ravel(), weights=self.amounts)
+        if self.amounts.dtype.kind in 'iu':
+            totals = totals.astype(np.int64)
+        order = np.argsort(first_index, kind='stable')
+        values = totals[order].tolist()
+        if self.float_mask is not None:
+            float_counts = np.bincount(inverse.ravel(), weights=self.float_mask)[order]
+            values = [int(v) if n == 0 else v for v, n in zip(values, float_counts)]
+        return dict(zip(unique_days[order].tolist(), values))
+
+    def hour_totals(self) -> np.ndarray:
+        """Amount consumed per hour of day (length 24)."""
+        return np.bincount(self.hours, weights=self.amounts, minlength=24)
+
+    def peak_hours(self, top: int = 3) -> List[int]:
+        # Stable sort keeps the earlier hour first on ties
+        return np.argsort(-self.hour_totals(), kind='stable')[:top].tolist()
+
+
+def _day_ordinals(daily_totals: Dict) -> np.ndarray:
+    return np.sort(np.array(list(daily_totals), dtype='datetime64[D]').astype(np.int64))
+
+
+def _longest_run(day_ordinals: np.ndarray) -> int:
+    """Length of the longest run of consecutive days in a sorted array."""
+    if not len(day_ordinals):
+        return 0
+    breaks = np.flatnonzero(np.diff(day_ordinals) != 1) + 1
+    bounds = np.concatenate(([0], breaks, [len(day_ordinals)]))
+    return int(np.diff(bounds).max())
+
+
+class IntakeAnalysisContext:
+    """Immutable, lazily evaluated analysis of one water log.
+
+    Each derived quantity is computed on first access and cached, so every
+    analyzer method (and AIService) sharing a context does each
+    aggregation exactly once.
+    """
+
+    def __init__(self, water_log: List[Dict], analyzer: 'WaterIntakeAnalyzer'):
+        object.__setattr__(self, 'water_log', water_log)
+        object.__setattr__(self, '_analyzer', analyzer)
+        object.__setattr__(self, '_goal_rates', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError('IntakeAnalysisContext is immutable')
+
+    def __len__(self) -> int:
+        return len(self.water_log)
+
+    @cached_property
+    def columns(self) -> IntakeColumns:
+        return IntakeColumns.from_log(self.water_log)
+
+    @cached_property
+    def daily_totals(self) -> MappingProxyType:
+        return MappingProxyType(self.columns.daily_totals())
+
+    @cached_property
+    def daily_average(self) -> float:
+        return np.mean(list(self.daily_totals.values()))
+
+    @cached_property
+    def total_intake(self) -> float:
+        return sum(self.daily_totals.values())
+
+    @cached_property
+    def peak_hours(self) -> Tuple[int, ...]:
+        return tuple(self.columns.peak_hours(3))
+
+    @cached_property
+    def consistency_score(self) -> float:
+        return self._analyzer._calculate_consistency_score(self.daily_totals)
+
+    @cached_property
+    def intake_trends(self) -> MappingProxyType:
+        return MappingProxyType(self._analyzer._analyze_intake_trends(self.daily_totals))
+
+    @cached_property
+    def streak(self) -> int:
+        return self._analyzer._calculate_streak(self.daily_totals)
+
+    @cached_property
+    def best_streak(self) -> int:
+        return self._analyzer._calculate_best_streak(self.daily_totals)
+
+    def goal_achievement_rate(self, daily_goal: float) -> float:
+        if daily_goal not in self._goal_rates:
+            self._goal_rates[daily_goal] = self._analyzer._calculate_goal_achievement_rate(
+                self.daily_totals, daily_goal
+            )
+        return self._goal_rates[daily_goal]
+
+
+LogOrContext = Union[List[Dict], IntakeAnalysisContext]
+
 
 class WaterIntakeAnalyzer:
-    def __init__(self):
-        self.scaler = StandardScaler()
-        self.model = RandomForestRegressor(n_estimators=100, random_state=42)
+    # sklearn is heavy to import and the models are only needed for
+    # forecasting, so both are built on first use rather than per instance
+    @cached_property
+    def scaler(self):
+        from sklearn.preprocessing import StandardScaler
+        return StandardScaler()
     
-    def analyze_intake_patterns(self, water_log: List[Dict]) -> Dict:
+    @cached_property
+    def model(self):
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(n_estimators=100, random_state=42)
+    
+    def build_context(self, water_log: LogOrContext) -> IntakeAnalysisContext:
+        """Wrap a water log in a shared, lazily computed analysis context."""
+        if isinstance(water_log, IntakeAnalysisContext):
+            return water_log
+        return IntakeAnalysisContext(water_log, self)
+    
+    def analyze_intake_patterns(self, water_log: LogOrContext) -> Dict:
         """Analyze water intake patterns and generate insights."""
         if not water_log:
             return self._generate_empty_analysis()
         
-        daily_totals = self._calculate_daily_totals(water_log)
-        consistency_score = self._calculate_consistency_score(daily_totals)
-        peak_hours = self._identify_peak_hours(water_log)
-        intake_trends = self._analyze_intake_trends(daily_totals)
+        context = self.build_context(water_log)
         
         return {
-            'consistency_score': consistency_score,
-            'peak_hydration_hours': peak_hours,
-            'intake_trends': intake_trends,
-            'daily_average': np.mean(list(daily_totals.values())),
-            'streak': self._calculate_streak(daily_totals)
+            'consistency_score': context.consistency_score,
+            'peak_hydration_hours': list(context.peak_hours),
+            'intake_trends': dict(context.intake_trends),
+            'daily_average': context.daily_average,
+            'streak': context.streak
         }
     
     def generate_personalized_recommendations(self,
                                             user_data: Dict,
-                                            water_log: List[Dict],
+                                            water_log: LogOrContext,
                                             weather_data: Dict) -> Dict:
         """Generate personalized hydration recommendations."""
         base_recommendation = self._calculate_base_recommendation(user_data)
@@ -48,35 +210,30 @@ class WaterIntakeAnalyzer:
     
     def generate_progress_report(self,
                                user_data: Dict,
-                               water_log: List[Dict],
+                               water_log: LogOrContext,
                                period: str = 'week') -> Dict:
         """Generate a comprehensive progress report."""
         if not water_log:
             return self._generate_empty_report()
         
-        analysis = self.analyze_intake_patterns(water_log)
-        daily_totals = self._calculate_daily_totals(water_log)
+        context = self.build_context(water_log)
         
         return {
             'period': period,
-            'total_intake': sum(daily_totals.values()),
-            'daily_average': analysis['daily_average'],
-            'goal_achievement_rate': self._calculate_goal_achievement_rate(daily_totals, user_data['daily_goal']),
-            'consistency_score': analysis['consistency_score'],
-            'improvement_areas': self._identify_improvement_areas(water_log, user_data),
-            'achievements': self._identify_achievements(water_log, user_data),
+            'total_intake': context.total_intake,
+            'daily_average': context.daily_average,
+            'goal_achievement_rate': context.goal_achievement_rate(user_data['daily_goal']),
+            'consistency_score': context.consistency_score,
+            'improvement_areas': self._identify_improvement_areas(context, user_data),
+            'achievements': self._identify_achievements(context, user_data),
             'streak_data': {
-                'current_streak': analysis['streak'],
-                'best_streak': self._calculate_best_streak(daily_totals)
+                'current_streak': context.streak,
+                'best_streak': context.best_streak
             }
         }
     
-    def _calculate_daily_totals(self, water_log: List[Dict]) -> Dict:
-        daily_totals = {}
-        for entry in water_log:
-            date = datetime.fromisoformat(entry['timestamp']).date()
-            daily_totals[date] = daily_totals.get(date, 0) + entry['amount']
-        return daily_totals
+    def _calculate_daily_totals(self, water_log: LogOrContext) -> Dict:
+        return dict(self.build_context(water_log).daily_totals)
     
     def _calculate_consistency_score(self, daily_totals: Dict) -> float:
         if not daily_totals:
@@ -87,25 +244,21 @@ class WaterIntakeAnalyzer:
         cv = (std / mean) if mean > 0 else 0
         return max(0, min(100, 100 * (1 - cv)))
     
-    def _identify_peak_hours(self, water_log: List[Dict]) -> List[int]:
-        hour_counts = [0] * 24
-        for entry in water_log:
-            hour = datetime.fromisoformat(entry['timestamp']).hour
-            hour_counts[hour] += entry['amount']
-        
+    def _identify_peak_hours(self, water_log: LogOrContext) -> List[int]:
         # Return top 3 hours
-        return sorted(range(24), key=lambda x: hour_counts[x], reverse=True)[:3]
+        return list(self.build_context(water_log).peak_hours)
     
     def _analyze_intake_trends(self, daily_totals: Dict) -> Dict:
         if not daily_totals:
             return {'trend': 'neutral', 'change_rate': 0}
         
-        dates = sorted(daily_totals.keys())
-        if len(dates) < 2:
+        if len(daily_totals) < 2:
             return {'trend': 'neutral', 'change_rate': 0}
         
-        values = [daily_totals[date] for date in dates]
-        change_rate = (values[-1] - values[0]) / values[0] if values[0] > 0 else 0
+        values = np.array(list(daily_totals.values()))
+        order = np.argsort(np.array(list(daily_totals), dtype='datetime64[D]'), kind='stable')
+        first, last = values[order[0]].item(), values[order[-1]].item()
+        change_rate = (last - first) / first if first > 0 else 0
         
         return {
             'trend': 'increasing' if change_rate > 0.1 else 'decreasing' if change_rate < -0.1 else 'stable',
@@ -113,37 +266,13 @@ class WaterIntakeAnalyzer:
         }
     
     def _calculate_streak(self, daily_totals: Dict) -> int:
-        if not daily_totals:
-            return 0
-        
-        dates = sorted(daily_totals.keys())
-        current_streak = 1
-        max_streak = 1
-        
-        for i in range(1, len(dates)):
-            if (dates[i] - dates[i-1]).days == 1:
-                current_streak += 1
-                max_streak = max(max_streak, current_streak)
-            else:
-                current_streak = 1
-        
-        return max_streak
+        return _longest_run(_day_ordinals(daily_totals))
+    
+    def _calculate_best_streak(self, daily_totals: Dict) -> int:
+        return _longest_run(_day_ordinals(daily_totals))
     
     def _calculate_base_recommendation(self, user_data: Dict) -> int:
-        weight = user_data.get('weight', 70)  # Default weight 70kg
-        height = user_data.get('height', 170)  # Default height 170cm
-        activity_level = user_data.get('activity_level', 'moderate')
-        
-        base = weight * 30  # 30ml per kg of body weight
-        height_factor = height / 170.0
-        
-        activity_multipliers = {
-            'low': 0.8,
-            'moderate': 1.0,
-            'high': 1.2
-        }
-        
-        return int(base * height_factor * activity_multipliers.get(activity_level, 1.0))
+        return recommend(*profile_inputs(user_data)).base_ml
     
     def _calculate_weather_adjustment(self, weather_data: Dict) -> int:
         temp = weather_data.get('temperature', 20)  # Default 20°C
@@ -155,19 +284,11 @@ class WaterIntakeAnalyzer:
         return int(temp_adjustment + humidity_adjustment)
     
     def _calculate_activity_adjustment(self, user_data: Dict) -> int:
-        activity_level = user_data.get('activity_level', 'moderate')
-        
-        adjustments = {
-            'low': 0,
-            'moderate': 300,
-            'high': 700
-        }
-        
-        return adjustments.get(activity_level, 0)
+        return recommend(*profile_inputs(user_data)).activity_adjustment_ml
     
     def _generate_personalized_tips(self,
                                    user_data: Dict,
-                                   water_log: List[Dict],
+                                   water_log: LogOrContext,
                                    weather_data: Dict) -> List[str]:
         tips = []
         
@@ -194,35 +315,35 @@ class WaterIntakeAnalyzer:
         achieved_days = sum(1 for total in daily_totals.values() if total >= daily_goal)
         return (achieved_days / len(daily_totals)) * 100 if daily_totals else 0
     
-    def _identify_improvement_areas(self, water_log: List[Dict], user_data: Dict) -> List[str]:
+    def _identify_improvement_areas(self, water_log: LogOrContext, user_data: Dict) -> List[str]:
         areas = []
-        daily_totals = self._calculate_daily_totals(water_log)
+        context = self.build_context(water_log)
         
-        if not daily_totals:
+        if not context.daily_totals:
             return ["Start tracking your water intake regularly"]
         
-        avg_intake = np.mean(list(daily_totals.values()))
+        avg_intake = context.daily_average
         if avg_intake < user_data['daily_goal']:
             areas.append("Increase daily water intake to meet your goal")
         
-        peak_hours = self._identify_peak_hours(water_log)
+        peak_hours = context.peak_hours
         if 8 not in peak_hours and 9 not in peak_hours:
             areas.append("Consider adding morning hydration to your routine")
         
         return areas
     
-    def _identify_achievements(self, water_log: List[Dict], user_data: Dict) -> List[str]:
+    def _identify_achievements(self, water_log: LogOrContext, user_data: Dict) -> List[str]:
         achievements = []
-        daily_totals = self._calculate_daily_totals(water_log)
+        context = self.build_context(water_log)
         
-        if not daily_totals:
+        if not context.daily_totals:
             return achievements
         
-        streak = self._calculate_streak(daily_totals)
+        streak = context.streak
         if streak >= 7:
             achievements.append("7-day streak achieved!")
         
-        goal_rate = self._calculate_goal_achievement_rate(daily_totals, user_data['daily_goal'])
+        goal_rate = context.goal_achievement_rate(user_data['daily_goal'])
         if goal_rate >= 80:
             achievements.append("Consistently meeting daily goals")
         
@@ -1,13 +1,26 @@
-from flask import Flask, jsonify, request, session, render_template, redirect
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from flask import Flask, jsonify, request, session, render_template, redirect, g
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, ServerSelectionTimeoutError
 from dotenv import load_dotenv
 import os
 import jwt
 import time
 from datetime import datetime, timedelta
 from functools import wraps
+import atexit
+import threading
 from services.water_service import WaterService
+from services.db_health import DatabaseHealthMonitor
+from services.mongo_client import get_database, get_pool_status
+from services.db_indexes import IndexManager
+from services.intake_repository import IntakeRepository
+from services.intake_rollups import IntakeRollups
+from services.intake_writer import IntakeWriter, validate_events
+from services.write_behind import IntakeWriteBuffer
+from services.cache import TTLCache
+from services.profile_cache import PROFILE_PROJECTION, profile_cache
+from services.insight_cache import insight_cache
+from services.weather_provider import get_weather_provider
+from services.recommendation import profile_inputs, recommend
 
 # Load environment variables
 load_dotenv()
@@ -23,66 +36,75 @@ def index():
         return render_template('dashboard.html')
     return render_template('login.html')
 
-# Initialize MongoDB connection with retry mechanism
-def get_db_connection(max_retries=3, retry_delay=2):
-    for attempt in range(max_retries):
-        try:
-            # Check if MONGO_URI is set
-            mongo_uri = os.getenv('MONGO_URI')
-            if not mongo_uri:
-                print('Error: MONGO_URI environment variable is not set')
-                return None
-
-            # Connect with serverSelectionTimeoutMS
-            client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-            
-            # Get database
-            db = client.water_tracker
-            
-            # Test the connection
-            db.command('ping')
-            
-            print(f'Successfully connected to MongoDB on attempt {attempt + 1}')
-            return db
-            
-        except Exception as e:
-            if attempt < max_retries - 1:
-                print(f'Failed to connect to MongoDB on attempt {attempt + 1}: {str(e)}')
-                print(f'Retrying in {retry_delay} seconds...')
-                time.sleep(retry_delay)
-            else:
-                print(f'Failed to connect to MongoDB after {max_retries} attempts: {str(e)}')
-                return None
-
-# Initialize database connection
-db = get_db_connection()
-
-if db is None:
-    print('Warning: Failed to establish initial database connection')
-
-# Function to ensure database connection is available
-def ensure_db_connection():
-    global db
-    if db is None:
-        print('Attempting to reconnect to database...')
-        db = get_db_connection()
-        if db is None:
-            return False
+# Database handle from the shared, pooled MongoClient. The client is created
+# once per process and reconnects on its own, so this never sleeps or leaks pools.
+def get_db_connection():
     try:
-        # Test the connection
-        db.command('ping')
-        return True
+        return get_database()
     except Exception as e:
-        print(f'Database connection test failed: {str(e)}')
-        # Try to reconnect
-        db = get_db_connection()
-        return db is not None
+        print(f'Failed to create MongoDB client: {str(e)}')
+        return None
+
+# Database handle, kept up to date by the health monitor
+db = None
+
+def _on_db_healthy(handle):
+    global db
+    db = handle
+
+# Background health monitor: pings and reconnects (with backoff) off the request thread
+db_monitor = DatabaseHealthMonitor(
+    get_db_connection,
+    check_interval=float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 10)),
+    max_backoff=float(os.getenv('DB_RECONNECT_MAX_BACKOFF', 60))
+)
+db_monitor.add_listener(_on_db_healthy)
+
+_indexes_ready = False
+
+def _bootstrap_indexes(handle):
+    # Create the unique indexes the hot routes depend on, once per process
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    report = IndexManager(handle).ensure_indexes()
+    _indexes_ready = all(result['success'] for result in report.values())
+
+db_monitor.add_listener(_bootstrap_indexes)
+db_monitor.start()
+
+if not db_monitor.is_healthy():
+    print('Warning: Failed to establish initial database connection')
 
-# Middleware to check database connection before each request
+# Optional write-behind buffering for /api/water/add
+write_buffer = None
+if os.getenv('WATER_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes'):
+    write_buffer = IntakeWriteBuffer(
+        lambda: IntakeWriter(db) if db is not None else None,
+        spill_dir=os.getenv('WRITE_BEHIND_SPILL_DIR', '.write_behind'),
+        max_events=int(os.getenv('WRITE_BEHIND_MAX_EVENTS', 200)),
+        flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', 2))
+    )
+    write_buffer.start()
+    atexit.register(write_buffer.stop)
+
+# Warm the weather cache for configured cities in the background
+def _prefetch_weather(cities):
+    result = get_weather_provider().prefetch_cities(
+        cities, concurrency=int(os.getenv('WEATHER_PREFETCH_CONCURRENCY', 8))
+    )
+    print(f"Weather prefetch: {result['fetched']} cities fetched, {result['failed']} failed")
+
+_prefetch_cities = [city for city in os.getenv('WEATHER_PREFETCH_CITIES', '').split(',') if city.strip()]
+if _prefetch_cities:
+    threading.Thread(target=_prefetch_weather, args=(_prefetch_cities,),
+                     name='weather-prefetch', daemon=True).start()
+
+# Middleware to short-circuit requests while the database is known to be down
 @app.before_request
 def check_db_connection():
     if request.endpoint and 'static' not in request.endpoint:
-        if not ensure_db_connection():
+        if not db_monitor.is_healthy():
             return jsonify({
                 'success': False,
                 'error': 'Database connection is not available',
@@ -96,7 +118,8 @@ def check_db_status():
         return jsonify({
             'status': 'error',
             'message': 'Database connection not available',
-            'details': 'Initial connection failed. Check MONGO_URI and network connectivity.'
+            'details': 'Initial connection failed. Check MONGO_URI and network connectivity.',
+            'monitor': db_monitor.status()
         }), 503
     
     try:
@@ -111,7 +134,8 @@ def check_db_status():
                 'version': server_info.get('version', 'unknown'),
                 'uptime': server_info.get('uptime', 0),
                 'connections': server_info.get('connections', {})
-            }
+            },
+            'monitor': db_monitor.status()
         })
     except ConnectionFailure as e:
         return jsonify({
@@ -132,17 +156,77 @@ def check_db_status():
             'details': str(e)
         }), 503
 
-# Token required decorator
+# Debug route confirming every hot route's query is served by an index.
+# It runs explain() on every hot query and reveals the database layout, so
+# it only answers in debug mode or with DEBUG_INDEX_CHECK enabled.
+@app.route('/api/debug/indexes')
+def check_db_indexes():
+    if not (app.debug or os.getenv('DEBUG_INDEX_CHECK', '').lower() in ('1', 'true', 'yes')):
+        return jsonify({
+            'status': 'error',
+            'message': 'Not found'
+        }), 404
+    try:
+        manager = IndexManager(db)
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'indexes': manager.verify(),
+                'hot_queries': manager.check_hot_queries()
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Failed to inspect indexes',
+            'details': str(e)
+        }), 500
+
+# Debug route reporting hit rates of the in-process caches
+@app.route('/api/debug/cache-stats')
+def check_cache_stats():
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'token_cache': token_cache.stats(),
+            'profile_cache': profile_cache.stats(),
+            'insight_cache': insight_cache.stats(),
+            'weather_cache': get_weather_provider().stats()
+        }
+    })
+
+# Debug route exposing connection pool usage for worker sizing
+@app.route('/api/debug/db-pool')
+def check_db_pool():
+    return jsonify({
+        'status': 'success',
+        'data': get_pool_status()
+    })
+
+# Verified token -> claims, so a polling session skips HMAC verification.
+# Entries expire with the token's own 'exp' claim.
+token_cache = TTLCache(
+    maxsize=int(os.getenv('TOKEN_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('TOKEN_CACHE_TTL', 300))
+)
+
+# Token required decorator: verifies once and exposes the claims as g.claims / g.phone
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         token = session.get('token')
         if not token:
             return jsonify({'success': False, 'error': 'Token is missing'}), 401
-        try:
-            data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-        except:
-            return jsonify({'success': False, 'error': 'Token is invalid'}), 401
+        data = token_cache.get(token)
+        if data is None:
+            try:
+                data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
+            except:
+                return jsonify({'success': False, 'error': 'Token is invalid'}), 401
+            expires_at = min(data.get('exp', float('inf')), time.time() + token_cache.ttl)
+            token_cache.set(token, data, expires_at=expires_at)
+        g.claims = data
+        g.phone = data.get('phone')
         return f(*args, **kwargs)
     return decorated
 
@@ -179,10 +263,16 @@ def user_profile():
                     'error': 'No valid fields to update'
                 }), 400
             
-            # Get user phone from token
-            token = session.get('token')
-            data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-            phone = data.get('phone')
+            # Get user phone from the verified token claims
+            phone = g.phone
+
+            # Precompute the daily goal so request paths read one stored number.
+            # The inputs come from MongoDB, not the cache: another worker's
+            # cached copy may predate an earlier profile update.
+            current = db.users.find_one({'phone': phone}, PROFILE_PROJECTION, max_time_ms=5000) or {}
+            valid_updates['daily_goal'] = recommend(
+                *profile_inputs({**current, **valid_updates})
+            ).daily_goal_ml
             
             # Update user profile
             result = db.users.update_one(
@@ -195,6 +285,9 @@ def user_profile():
                     'success': False,
                     'error': 'Profile not found or no changes made'
                 }), 404
+
+            # Drop the cached copy so the next read sees the update
+            profile_cache.invalidate(phone)
             
             return jsonify({
                 'success': True,
@@ -210,17 +303,8 @@ def user_profile():
             }), 500
 
     try:
-        token = session.get('token')
-        if not token:
-            print('Error: Authentication token is missing')
-            return jsonify({
-                'success': False,
-                'error': 'Authentication token is missing'
-            }), 401
-
-        # Decode token and extract user info
-        data = jwt.decode(token, app.secret_key, algorithms=["HS256"])
-        phone = data.get('phone')
+        # User info from the verified token claims
+        phone = g.phone
         if not phone:
             print('Error: Phone number missing in token payload')
             return jsonify({
@@ -231,14 +315,11 @@ def user_profile():
 
         print(f'Fetching user profile for phone: {phone}')
         try:
-            # Attempt database query with timeout
-            user = db.users.find_one(
-                {'phone': phone},
-                {'name': 1, 'gender': 1, 'weight': 1, 'height': 1, 'activity_level': 1, 'daily_goal': 1, '_id': 1},
-                max_time_ms=5000
-            )
+            # Read through the profile cache (database query with timeout on a miss)
+            user = profile_cache.get(db, phone)
         except ConnectionFailure as e:
             print(f'Database connection error: {str(e)}')
+            db_monitor.request_check()
             return jsonify({
                 'success': False,
                 'error': 'Database connection error',
@@ -275,18 +356,6 @@ def user_profile():
             'data': profile_data
         })
 
-    except jwt.ExpiredSignatureError as e:
-        print(f'Token expired: {str(e)}')
-        return jsonify({
-            'success': False,
-            'error': 'Authentication token has expired'
-        }), 401
-    except jwt.InvalidTokenError as e:
-        print(f'Invalid token: {str(e)}')
-        return jsonify({
-            'success': False,
-            'error': 'Invalid authentication token'
-        }), 401
     except Exception as e:
         print(f'Unexpected error in get_user_profile: {str(e)}')
         return jsonify({
@@ -346,12 +415,16 @@ def signup():
             'name': name,
             'phone': phone,
             'password': password,  # In production, store hashed password
+            'daily_goal': recommend(*profile_inputs({})).daily_goal_ml,
             'created_at': time.time()
         }
         
         try:
             db.users.insert_one(new_user)
             return redirect('/login')
+        except DuplicateKeyError:
+            # Concurrent signup with the same phone, caught by the unique index
+            return 'Phone number already registered', 409
         except Exception as e:
             return f'Registration failed: {str(e)}', 500
 
@@ -364,17 +437,8 @@ def logout():
 @token_required
 def get_weekly_stats():
     try:
-        if not ensure_db_connection():
-            return jsonify({
-                'success': False,
-                'error': 'Database connection is not available',
-                'details': 'Server is experiencing database connectivity issues'
-            }), 503
-
-        # Get user's phone from token
-        token = session.get('token')
-        data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-        user_phone = data.get('phone')
+        # Get user's phone from the verified token claims
+        user_phone = g.phone
         if not user_phone:
             return jsonify({
                 'success': False,
@@ -387,47 +451,40 @@ def get_weekly_stats():
         # Calculate start of week (Monday)
         start_of_week = current_date - timedelta(days=current_date.weekday())
         
-        # Query water intake records for the past week
-        weekly_records = db.water_intake.find({
-            'user_phone': user_phone,
-            'date': {'$gte': start_of_week.isoformat()}
-        })
+        # Incrementally maintained rollups answer this in one small read
+        summary = IntakeRollups(db).get_summary(user_phone, current_date)
+        if summary is not None:
+            week = summary['week']
+            return jsonify({
+                'success': True,
+                'data': {
+                    'streak': summary['all'].get('current_streak', 0),
+                    'weekly_average': round(week.get('total', 0) / max(week.get('days_logged', 0), 1)),
+                    'best_day': week.get('best_day', 0)
+                }
+            })
+
+        # No rollups yet (history predates them): per-day totals for the past week, summed server-side
+        daily_totals = IntakeRepository(db).get_daily_totals(
+            user_phone, start_of_week.isoformat()
+        )
 
         try:
-            # Calculate statistics
-            daily_totals = {}
+            # Calculate statistics over the (at most 7) daily totals
             streak = 0
-            current_streak = 0
             today = datetime.now().date()
-            
-            # Process weekly records
-            for record in weekly_records:
-                try:
-                    date = datetime.strptime(record['date'], '%Y-%m-%d').date()
-                    amount = float(record.get('amount', 0))
-                    
-                    if amount > 0:  # Only count valid intake amounts
-                        if date not in daily_totals:
-                            daily_totals[date] = 0
-                        daily_totals[date] += amount
-                except (ValueError, KeyError) as e:
-                    print(f'Error processing record: {e}')
-                    continue
-
-            # Calculate streak
-            dates = sorted(daily_totals.keys(), reverse=True)
-            for date in dates:
-                if (today - date).days <= len(dates):  # Only count consecutive days
-                    if daily_totals[date] > 0:
-                        streak += 1
-                    else:
-                        break
+
+            # Calculate streak (totals are sorted newest first)
+            for day in daily_totals:
+                date = datetime.fromisoformat(day['date']).date()
+                if (today - date).days <= len(daily_totals):  # Only count consecutive days
+                    streak += 1
                 else:
                     break
 
             # Calculate best day and weekly average
-            best_day = max(daily_totals.values()) if daily_totals else 0
-            total_intake = sum(daily_totals.values())
+            best_day = max((day['total'] for day in daily_totals), default=0)
+            total_intake = sum(day['total'] for day in daily_totals)
             days_recorded = len(daily_totals)
             weekly_average = round(total_intake / max(days_recorded, 1))
 
@@ -461,16 +518,8 @@ def get_water_data():
         # Add logging for debugging
         app.logger.info('Fetching water data')
         
-        if not ensure_db_connection():
-            return jsonify({
-                'success': False,
-                'error': 'Database connection is not available'
-            }), 503
-
-        # Get user's phone from token
-        token = session.get('token')
-        data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-        phone = data.get('phone')
+        # Get user's phone from the verified token claims
+        phone = g.phone
         
         if not phone:
             app.logger.error('User not authenticated')
@@ -483,40 +532,19 @@ def get_water_data():
         today = datetime.now().date().isoformat()
         yesterday = (datetime.now().date() - timedelta(days=1)).isoformat()
 
-        # Get user profile for recommended intake
-        user = db.users.find_one({'phone': phone})
-        if not user:
+        # Today's and yesterday's totals plus the recommended intake, in one round trip
+        intake = IntakeRepository(db).get_dashboard_intake(phone, today, yesterday)
+        if intake is None:
             return jsonify({
                 'success': False,
                 'error': 'User profile not found'
             }), 404
 
-        # Calculate recommended intake based on user profile
-        weight = user.get('weight', 70)  # default to 70kg
-        activity_level = user.get('activity_level', 'moderate')
-        
-        # Basic calculation: 30ml per kg of body weight
-        recommended_intake = weight * 30
-        
-        # Adjust based on activity level
-        activity_multipliers = {
-            'sedentary': 1.0,
-            'light': 1.2,
-            'moderate': 1.4,
-            'active': 1.6,
-            'very_active': 1.8
-        }
-        recommended_intake *= activity_multipliers.get(activity_level, 1.0)
-
-        # Get today's water intake
-        today_intake = db.water_intake.find_one(
-            {'phone': phone, 'date': today}
-        )
-        
-        # Get yesterday's water intake
-        yesterday_intake = db.water_intake.find_one(
-            {'phone': phone, 'date': yesterday}
-        )
+        # Read-your-writes: include entries still waiting in the write-behind buffer
+        if write_buffer is not None:
+            pending = write_buffer.pending_totals(phone, [today, yesterday])
+            intake['today_intake'] += pending[today]
+            intake['yesterday_intake'] += pending[yesterday]
 
         # Get a motivational quote
         quotes = [
@@ -538,9 +566,9 @@ def get_water_data():
         return jsonify({
             'success': True,
             'data': {
-                'today_intake': today_intake.get('total_intake', 0) if today_intake else 0,
-                'yesterday_intake': yesterday_intake.get('total_intake', 0) if yesterday_intake else 0,
-                'recommended_intake': int(recommended_intake),
+                'today_intake': intake['today_intake'],
+                'yesterday_intake': intake['yesterday_intake'],
+                'recommended_intake': int(intake['recommended_intake']),
                 'daily_quote': daily_quote,
                 'next_refresh': next_refresh.isoformat()
             }
@@ -557,12 +585,6 @@ def get_water_data():
 @app.route('/api/water/add', methods=['POST'])
 @token_required
 def add_water_intake():
-    if not ensure_db_connection():
-        return jsonify({
-            'success': False,
-            'error': 'Database connection is not available'
-        }), 503
-
     try:
         amount = request.json.get('amount')
         if not amount or not isinstance(amount, (int, float)) or amount <= 0:
@@ -571,33 +593,12 @@ def add_water_intake():
                 'error': 'Invalid amount provided'
             }), 400
 
-        token = session.get('token')
-        data = jwt.decode(token, app.secret_key, algorithms=['HS256'])
-        phone = data.get('phone')
-
-        # Get today's date in YYYY-MM-DD format
-        today = time.strftime('%Y-%m-%d')
-        current_time = time.strftime('%H:%M:%S')
+        phone = g.phone
 
-        # Create new intake record
-        new_record = {
-            'amount': amount,
-            'timestamp': current_time
-        }
-
-        # Update or create water intake document for today
-        result = db.water_intake.update_one(
-            {
-                'phone': phone,
-                'date': today
-            },
-            {
-                '$push': {'intake_records': new_record},
-                '$inc': {'total_intake': amount},
-                '$setOnInsert': {'created_at': time.time()}
-            },
-            upsert=True
-        )
+        if write_buffer is not None:
+            write_buffer.add(phone, amount)
+        else:
+            IntakeWriter(db).record(phone, amount)
 
         return jsonify({
             'success': True,
@@ -612,5 +613,44 @@ def add_water_intake():
             'details': str(e)
         }), 500
 
+@app.route('/api/water/add/batch', methods=['POST'])
+@token_required
+def add_water_intake_batch():
+    try:
+        payload = request.json or {}
+        events, rejected = validate_events(
+            payload.get('events'),
+            batch_key=request.headers.get('Idempotency-Key')
+        )
+        if not events:
+            return jsonify({
+                'success': False,
+                'error': 'No valid events provided',
+                'rejected': rejected
+            }), 400
+
+        phone = g.phone
+        for event in events:
+            event['phone'] = phone
+
+        result = IntakeWriter(db).record_batch(events)
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'accepted': result['accepted'],
+                'duplicates': result['duplicates'],
+                'rejected': rejected
+            }
+        })
+
+    except Exception as e:
+        print(f'Error recording water intake batch: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to record water intake batch',
+            'details': str(e)
+        }), 500
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
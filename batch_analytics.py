@@ -0,0 +1,279 @@
+import numpy as np
+from datetime import datetime
+from typing import Dict, Hashable, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+
+SECONDS_PER_DAY = 86400
+DEFAULT_CHUNK_ROWS = 500_000
+PEAK_HOURS = 3
+
+
+def _local_utc_offset() -> int:
+    return int(datetime.now().astimezone().utcoffset().total_seconds())
+
+
+class IntakeTable:
+    """Intake entries for many users as parallel columns.
+
+    `timestamps` is datetime64 wall-clock time (the same clock the
+    per-user analyzer reads from ISO strings); `user_ids` can be any
+    hashable values, e.g. phone numbers.
+    """
+
+    def __init__(self, user_ids: np.ndarray, timestamps: np.ndarray, amounts: np.ndarray):
+        if not (len(user_ids) == len(timestamps) == len(amounts)):
+            raise ValueError('user_ids, timestamps and amounts must have the same length')
+        self.user_ids = np.asarray(user_ids)
+        self.timestamps = np.asarray(timestamps).astype('datetime64[s]')
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    @classmethod
+    def from_epoch(cls, user_ids, seconds, amounts,
+                   utc_offset: Optional[int] = None) -> 'IntakeTable':
+        """Build from epoch seconds, shifted to wall-clock time by `utc_offset` (default: local)."""
+        offset = _local_utc_offset() if utc_offset is None else utc_offset
+        seconds = np.asarray(seconds, dtype=np.int64) + offset
+        return cls(user_ids, seconds.astype('datetime64[s]'), amounts)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[Hashable, object, float]]) -> 'IntakeTable':
+        """Build from (user_id, timestamp, amount) rows; timestamps are ISO strings or datetimes."""
+        user_ids, timestamps, amounts = [], [], []
+        for user_id, timestamp, amount in records:
+            user_ids.append(user_id)
+            timestamps.append(timestamp)
+            amounts.append(amount)
+        return cls(np.array(user_ids), np.array(timestamps, dtype='datetime64[s]'), amounts)
+
+    @classmethod
+    def iter_chunks(cls, records: Iterable[Tuple[Hashable, object, float]],
+                    chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator['IntakeTable']:
+        """Build tables of at most `chunk_rows` rows from a stream of records."""
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= chunk_rows:
+                yield cls.from_records(batch)
+                batch = []
+        if batch:
+            yield cls.from_records(batch)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[Hashable, int, float]],
+                  chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator['IntakeTable']:
+        """Build tables of at most `chunk_rows` rows from (user_id, wall-clock epoch seconds, amount)."""
+        user_ids, seconds, amounts = [], [], []
+        for user_id, second, amount in rows:
+            user_ids.append(user_id)
+            seconds.append(second)
+            amounts.append(amount)
+            if len(user_ids) >= chunk_rows:
+                yield cls(np.array(user_ids), np.array(seconds, dtype='datetime64[s]'), amounts)
+                user_ids, seconds, amounts = [], [], []
+        if user_ids:
+            yield cls(np.array(user_ids), np.array(seconds, dtype='datetime64[s]'), amounts)
+
+    def slice(self, start: int, stop: int) -> 'IntakeTable':
+        return IntakeTable(self.user_ids[start:stop], self.timestamps[start:stop], self.amounts[start:stop])
+
+    def split(self, chunk_rows: int) -> Iterator['IntakeTable']:
+        for start in range(0, len(self), chunk_rows):
+            yield self.slice(start, start + chunk_rows)
+
+    @staticmethod
+    def concat(tables: List['IntakeTable']) -> 'IntakeTable':
+        return IntakeTable(
+            np.concatenate([t.user_ids for t in tables]),
+            np.concatenate([t.timestamps for t in tables]),
+            np.concatenate([t.amounts for t in tables])
+        )
+
+
+def _check_contiguous(table: IntakeTable) -> IntakeTable:
+    changes = np.count_nonzero(table.user_ids[1:] != table.user_ids[:-1]) + 1
+    if changes != len(np.unique(table.user_ids)):
+        raise ValueError('User rows must be contiguous in the stream; sort by user first')
+    return table
+
+
+def user_chunks(tables: Iterable[IntakeTable], chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[IntakeTable]:
+    """Re-chunk a user-contiguous stream so no user's rows span two chunks.
+
+    The last user of every chunk is held back and joined with the next one,
+    so memory is bounded by `chunk_rows` plus one user's rows.
+    """
+    carry = None
+    for table in tables:
+        for piece in table.split(chunk_rows):
+            if carry is not None:
+                piece = IntakeTable.concat([carry, piece])
+                carry = None
+            if not len(piece):
+                continue
+            others = np.flatnonzero(piece.user_ids != piece.user_ids[-1])
+            boundary = others[-1] + 1 if len(others) else 0
+            carry = piece.slice(boundary, len(piece))
+            if boundary:
+                yield _check_contiguous(piece.slice(0, boundary))
+    if carry is not None and len(carry):
+        yield _check_contiguous(carry)
+
+
+class BatchMetrics:
+    """Per-user metrics for one batch, one array element per user."""
+
+    def __init__(self, user_ids: np.ndarray, days_logged: np.ndarray,
+                 total_intake: np.ndarray, daily_average: np.ndarray,
+                 consistency_score: np.ndarray, goal_achievement_rate: np.ndarray,
+                 streak: np.ndarray, peak_hours: np.ndarray,
+                 trend_change_rate: np.ndarray,
+                 daily_users: np.ndarray, daily_days: np.ndarray, daily_totals: np.ndarray):
+        self.user_ids = user_ids
+        self.days_logged = days_logged
+        self.total_intake = total_intake
+        self.daily_average = daily_average
+        self.consistency_score = consistency_score
+        self.goal_achievement_rate = goal_achievement_rate
+        self.streak = streak
+        self.peak_hours = peak_hours
+        self.trend_change_rate = trend_change_rate
+        # Daily totals as (user index, day, total) rows, sorted by user then day
+        self.daily_users = daily_users
+        self.daily_days = daily_days
+        self.daily_totals = daily_totals
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def daily_totals_for(self, index: int) -> Dict[str, float]:
+        rows = np.flatnonzero(self.daily_users == index)
+        return dict(zip(self.daily_days[rows].astype(str).tolist(), self.daily_totals[rows].tolist()))
+
+    def trend(self, index: int) -> Dict:
+        change_rate = float(self.trend_change_rate[index])
+        if self.days_logged[index] < 2:
+            return {'trend': 'neutral', 'change_rate': 0}
+        return {
+            'trend': 'increasing' if change_rate > 0.1 else 'decreasing' if change_rate < -0.1 else 'stable',
+            'change_rate': change_rate
+        }
+
+    def iter_reports(self, period: str = 'week') -> Iterator[Tuple[Hashable, Dict]]:
+        """Yield (user_id, report) pairs shaped like WaterIntakeAnalyzer's output."""
+        for i, user_id in enumerate(self.user_ids.tolist()):
+            streak = int(self.streak[i])
+            yield user_id, {
+                'period': period,
+                'total_intake': float(self.total_intake[i]),
+                'daily_average': float(self.daily_average[i]),
+                'goal_achievement_rate': float(self.goal_achievement_rate[i]),
+                'consistency_score': float(self.consistency_score[i]),
+                'peak_hydration_hours': self.peak_hours[i].tolist(),
+                'intake_trends': self.trend(i),
+                'streak_data': {
+                    'current_streak': streak,
+                    'best_streak': streak
+                }
+            }
+
+
+class BatchAnalyticsEngine:
+    """Vectorized progress metrics for many users at once.
+
+    Every metric is a grouped reduction (bincount / reduceat) over the
+    whole table instead of a Python loop per user; `analyze_stream` keeps
+    memory bounded by processing a large table chunk by chunk.
+    """
+
+    def __init__(self, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+
+    def analyze(self, table: IntakeTable,
+                goals: Optional[Mapping[Hashable, float]] = None) -> BatchMetrics:
+        """Metrics for every user in one in-memory table."""
+        goals = goals or {}
+        users, user_codes = np.unique(table.user_ids, return_inverse=True)
+        user_codes = user_codes.ravel().astype(np.int64)
+        n_users = len(users)
+
+        seconds = table.timestamps.astype(np.int64)
+        days = np.floor_divide(seconds, SECONDS_PER_DAY)
+        hours = np.floor_divide(seconds - days * SECONDS_PER_DAY, 3600)
+
+        # Daily totals: one group per (user, day), sorted by user then day
+        if len(days):
+            first_day = days.min()
+            span = int(days.max() - first_day) + 1
+        else:
+            first_day, span = 0, 1
+        user_day_keys, user_day_index = np.unique(user_codes * span + (days - first_day),
+                                                  return_inverse=True)
+        daily_totals = np.bincount(user_day_index.ravel(), weights=table.amounts)
+        daily_users = user_day_keys // span
+        daily_days = user_day_keys % span + first_day
+
+        days_logged = np.bincount(daily_users, minlength=n_users)
+        total_intake = np.bincount(daily_users, weights=daily_totals, minlength=n_users)
+        daily_average = total_intake / np.maximum(days_logged, 1)
+
+        # Consistency: 100 * (1 - coefficient of variation of daily totals)
+        deviations = (daily_totals - daily_average[daily_users]) ** 2
+        std = np.sqrt(np.bincount(daily_users, weights=deviations, minlength=n_users)
+                      / np.maximum(days_logged, 1))
+        cv = np.divide(std, daily_average, out=np.zeros(n_users), where=daily_average > 0)
+        consistency_score = np.clip(100 * (1 - cv), 0, 100)
+
+        # Goal achievement: share of logged days at or above the user's goal
+        user_goals = np.array([goals.get(user_id, 0) or 0 for user_id in users.tolist()],
+                              dtype=np.float64)
+        goal_hits = np.bincount(daily_users, weights=daily_totals >= user_goals[daily_users],
+                                minlength=n_users)
+        goal_achievement_rate = np.divide(goal_hits * 100, days_logged, out=np.zeros(n_users),
+                                          where=(user_goals > 0) & (days_logged > 0))
+
+        # Streak: longest run of consecutive logged days
+        user_starts = np.searchsorted(daily_users, np.arange(n_users))
+        continues = np.zeros(len(daily_days), dtype=bool)
+        continues[1:] = (np.diff(daily_days) == 1) & (daily_users[1:] == daily_users[:-1])
+        run_starts = np.flatnonzero(~continues)
+        run_lengths = np.diff(np.append(run_starts, len(daily_days)))
+        first_run = np.searchsorted(run_starts, user_starts)
+        streak = (np.maximum.reduceat(run_lengths, first_run) if n_users
+                  else np.zeros(0, dtype=np.int64))
+
+        # Trend: change between the first and last logged day
+        user_ends = np.append(user_starts[1:], len(daily_days)) - 1
+        first_totals = daily_totals[user_starts] if n_users else np.zeros(0)
+        last_totals = daily_totals[user_ends] if n_users else np.zeros(0)
+        trend_change_rate = np.divide(last_totals - first_totals, first_totals,
+                                      out=np.zeros(n_users), where=first_totals > 0)
+
+        # Peak hours: top hours of the per-user 24-hour histogram, earlier hour first on ties
+        hour_totals = np.bincount(user_codes * 24 + hours, weights=table.amounts,
+                                  minlength=n_users * 24).reshape(n_users, 24)
+        peak_hours = np.argsort(-hour_totals, axis=1, kind='stable')[:, :PEAK_HOURS]
+
+        return BatchMetrics(
+            users, days_logged, total_intake, daily_average, consistency_score,
+            goal_achievement_rate, streak, peak_hours, trend_change_rate,
+            daily_users, daily_days.astype('datetime64[D]'), daily_totals
+        )
+
+    def analyze_stream(self, tables: Iterable[IntakeTable],
+                       goals: Optional[Mapping[Hashable, float]] = None) -> Iterator[BatchMetrics]:
+        """Metrics for a stream of tables, one result per chunk.
+
+        Each user's rows must be contiguous in the stream (e.g. a cursor
+        sorted by user); see `user_chunks`.
+        """
+        for chunk in user_chunks(tables, self.chunk_rows):
+            yield self.analyze(chunk, goals)
+
+    def analyze_all(self, tables: Iterable[IntakeTable],
+                    goals: Optional[Mapping[Hashable, float]] = None) -> Iterator[Tuple[Hashable, Dict]]:
+        """Convenience wrapper: stream (user_id, report) pairs for every user."""
+        for metrics in self.analyze_stream(tables, goals):
+            yield from metrics.iter_reports()
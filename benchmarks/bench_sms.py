@@ -0,0 +1,174 @@
+"""SMS client benchmark: import cost and per-send overhead.
+
+Import: each sample is a fresh interpreter importing sms_service. The
+"before" scenario also imports twilio.rest and builds a Client, which
+is what the module used to do at import time.
+
+Send: messages.create() runs against a local stand-in for the Twilio
+Messages API (HTTP/1.1 keep-alive, canned 201 response), so the numbers
+are client-side overhead: SDK work plus connection setup. The stand-in
+counts TCP connections, which shows whether sends reuse them.
+
+    python benchmarks/bench_sms.py --sends 500 --concurrency 8
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TWILIO_BASE = 'https://api.twilio.com'
+CREDENTIALS = {'TWILIO_ACCOUNT_SID': 'AC' + '0' * 32, 'TWILIO_AUTH_TOKEN': 'bench-token',
+               'TWILIO_PHONE_NUMBER': '+15550000000'}
+
+CHILD = '''
+import importlib, json, sys, time
+started = time.perf_counter()
+if {eager!r}:
+    import os
+    from twilio.rest import Client
+    Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
+importlib.import_module('sms_service')
+print(json.dumps({{'seconds': time.perf_counter() - started,
+                  'twilio_loaded': 'twilio.rest' in sys.modules}}))
+'''
+
+
+def measure_import(eager, runs):
+    seconds = []
+    twilio_loaded = False
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, '-c', CHILD.format(eager=eager)], cwd=ROOT,
+                              env={**os.environ, **CREDENTIALS}, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f'Import benchmark failed: {proc.stderr.strip()}')
+        sample = json.loads(proc.stdout.strip().splitlines()[-1])
+        seconds.append(sample['seconds'])
+        twilio_loaded = sample['twilio_loaded']
+    return {
+        'import_ms_median': round(statistics.median(seconds) * 1000, 1),
+        'import_ms_max': round(max(seconds) * 1000, 1),
+        'twilio_loaded': twilio_loaded
+    }
+
+
+class FakeMessagesAPI(BaseHTTPRequestHandler):
+    """Answers every POST like Twilio's Messages.json endpoint."""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this, keep-alive requests stall on delayed ACKs
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with FakeMessagesAPI.lock:
+            FakeMessagesAPI.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'sid': 'SM' + '0' * 32, 'status': 'queued'}).encode()
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def point_at(client, base_url):
+    """Send the client's requests to `base_url` through the adapter it uses for Twilio."""
+    http_client = client.http_client
+    request = http_client.request
+    if http_client.session is not None:
+        http_client.session.mount('http://', http_client.session.get_adapter(TWILIO_BASE))
+
+    def local_request(method, url, *args, **kwargs):
+        return request(method, url.replace(TWILIO_BASE, base_url), *args, **kwargs)
+
+    http_client.request = local_request
+    return client
+
+
+def measure_sends(client_for_send, base_url, sends, concurrency):
+    FakeMessagesAPI.connections = 0
+    latencies = []
+
+    def send(i):
+        started = time.perf_counter()
+        client_for_send().messages.create(body=f'Benchmark message {i}',
+                                          from_=CREDENTIALS['TWILIO_PHONE_NUMBER'],
+                                          to='+15551234567')
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(sends)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'sends_per_sec': round(sends / elapsed, 1),
+        'latency_ms_p50': round(latencies[len(latencies) // 2] * 1000, 2),
+        'latency_ms_p99': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        'tcp_connections': FakeMessagesAPI.connections
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure sms_service import time and per-send overhead')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per import scenario')
+    parser.add_argument('--sends', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    os.environ.update(CREDENTIALS)
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+    import sms_service
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeMessagesAPI)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    def client_per_send():
+        return point_at(Client(CREDENTIALS['TWILIO_ACCOUNT_SID'], CREDENTIALS['TWILIO_AUTH_TOKEN'],
+                               http_client=TwilioHttpClient(pool_connections=False)), base_url)
+
+    sdk_default = point_at(Client(CREDENTIALS['TWILIO_ACCOUNT_SID'],
+                                  CREDENTIALS['TWILIO_AUTH_TOKEN']), base_url)
+    pooled = point_at(sms_service.get_twilio_client(), base_url)
+
+    results = {
+        'import: before (client built at import)': measure_import(True, args.runs),
+        'import: after (lazy client)': measure_import(False, args.runs),
+        'send: new client and connection per send': measure_sends(
+            client_per_send, base_url, args.sends, args.concurrency),
+        'send: shared client, SDK default pool': measure_sends(
+            lambda: sdk_default, base_url, args.sends, args.concurrency),
+        'send: sms_service.get_twilio_client()': measure_sends(
+            lambda: pooled, base_url, args.sends, args.concurrency)
+    }
+    server.shutdown()
+
+    print(f'{args.runs} import runs; {args.sends} sends at concurrency {args.concurrency}')
+    for name, result in results.items():
+        print(f'\n{name}')
+        for key, value in result.items():
+            print(f'  {key:20} {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Worker cold-start benchmark: import time and resident memory.
+
+Each sample is a fresh interpreter that imports the target modules, the
+same work every gunicorn worker does when the app is not preloaded.
+`--workers N` starts N of them at once and sums their RSS, which is what
+a worker pool costs. The "before" scenario additionally imports the
+modules that used to be loaded eagerly (sklearn.ensemble,
+sklearn.preprocessing, openai) and builds an analyzer with its
+RandomForestRegressor, reproducing the old startup path.
+
+    python benchmarks/bench_startup.py --workers 4 --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ['ai_analytics', 'services.ai_service', 'routes.ai_routes']
+EAGER_MODULES = ['sklearn.ensemble', 'sklearn.preprocessing', 'openai']
+
+CHILD = '''
+import importlib, json, resource, sys, time
+started = time.perf_counter()
+for name in {preload!r} + {modules!r}:
+    importlib.import_module(name)
+if {build_model!r}:
+    import ai_analytics
+    ai_analytics.WaterIntakeAnalyzer().model
+elapsed = time.perf_counter() - started
+rss_kb = 0
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+print(json.dumps({{'seconds': elapsed, 'rss_kb': rss_kb,
+                  'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'sklearn_loaded': 'sklearn' in sys.modules,
+                  'openai_loaded': 'openai' in sys.modules}}))
+'''
+
+
+def _start_worker(modules, preload, build_model):
+    code = CHILD.format(modules=modules, preload=preload, build_model=build_model)
+    return subprocess.Popen([sys.executable, '-c', code], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def run_scenario(modules, preload, build_model, workers, runs):
+    """Start `workers` cold interpreters at once, `runs` times; return summary stats."""
+    seconds, worker_rss, pool_rss = [], [], []
+    loaded = {}
+    for _ in range(runs):
+        procs = [_start_worker(modules, preload, build_model) for _ in range(workers)]
+        samples = []
+        for proc in procs:
+            out, err = proc.communicate()
+            if proc.returncode != 0:
+                raise RuntimeError(f'Benchmark worker failed: {err.strip()}')
+            samples.append(json.loads(out.strip().splitlines()[-1]))
+        seconds.extend(sample['seconds'] for sample in samples)
+        worker_rss.extend(sample['max_rss_kb'] for sample in samples)
+        pool_rss.append(sum(sample['max_rss_kb'] for sample in samples))
+        loaded = {key: samples[0][key] for key in ('sklearn_loaded', 'openai_loaded')}
+    return {
+        'import_seconds_median': round(statistics.median(seconds), 4),
+        'import_seconds_max': round(max(seconds), 4),
+        'worker_rss_mb_median': round(statistics.median(worker_rss) / 1024, 1),
+        'pool_rss_mb_median': round(statistics.median(pool_rss) / 1024, 1),
+        **loaded
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker cold-import time and RSS')
+    parser.add_argument('--modules', default=','.join(DEFAULT_MODULES),
+                        help='comma-separated modules a worker imports at boot')
+    parser.add_argument('--workers', type=int, default=4, help='workers started concurrently')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    modules = [name for name in args.modules.split(',') if name]
+    scenarios = {
+        'before (eager sklearn/openai, model built)': run_scenario(
+            modules, EAGER_MODULES, True, args.workers, args.runs),
+        'after (lazy)': run_scenario(modules, [], False, args.workers, args.runs)
+    }
+    print(f'{args.workers} workers x {args.runs} runs, importing {", ".join(modules)}')
+    for name, result in scenarios.items():
+        print(f'\n{name}')
+        for key, value in result.items():
+            print(f'  {key:24} {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,8 @@ class AIConfig:
             "api_key": "",  # Replace with actual API key
             "model": "gpt-4",  # or another appropriate model
             "max_tokens": 1000,
-            "temperature": 0.7
+            "temperature": 0.7,
+            "request_timeout": 30  # seconds
         }
         
         # Weather API configuration
@@ -0,0 +1,297 @@
+"""End-of-day intake forecasting.
+
+One global model predicts how much more a user will drink today from the
+hour, weekday, intake so far and profile. It is trained offline on the
+stored entries with the analyzer's (previously unused) StandardScaler and
+RandomForestRegressor, saved uncompressed with joblib and loaded with
+mmap_mode='r', so workers read the arrays from the page cache instead of
+each unpickling a private copy of the whole file.
+
+    python intake_forecast.py --days 60
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from batch_analytics import SECONDS_PER_DAY, IntakeTable, user_chunks
+from services.intake_buckets import IntakeBuckets
+from services.profile_cache import PROFILE_PROJECTION, profile_cache
+from services.recommendation import daily_goal_for, profile_inputs
+
+load_dotenv()
+
+MODEL_PATH = os.getenv('FORECAST_MODEL_PATH', os.path.join('models', 'intake_forecast.joblib'))
+FEATURES = ['hour', 'weekday', 'intake_so_far', 'entries_so_far',
+            'weight', 'height', 'activity', 'daily_goal']
+# Cut-off hours sampled from each historical day when training
+TRAIN_HOURS = np.arange(6, 23)
+PREDICT_BATCH_SIZE = 10000
+ACTIVITY_CODES = {
+    'sedentary': 0, 'low': 0, 'light': 1, 'moderate': 2,
+    'active': 3, 'high': 3, 'very_active': 4
+}
+
+
+def profile_features(profile: Dict) -> Tuple[float, float, float, float]:
+    """(weight, height, activity code, daily goal) for a stored profile."""
+    weight, height, activity_level = profile_inputs(profile)
+    return weight, height, ACTIVITY_CODES.get(activity_level, 2), daily_goal_for(profile)
+
+
+def build_training_set(tables: Iterable[IntakeTable], profiles: Dict[str, Tuple],
+                       max_samples: Optional[int] = None,
+                       seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """Features and remaining-intake targets for every (user, day, cut-off hour).
+
+    Tables must be user-contiguous (see batch_analytics.user_chunks) and
+    contain whole days only. With `max_samples`, a uniform sample of that
+    size is kept as the tables stream past: each sample draws a random
+    priority and only the lowest `max_samples` survive each table, so
+    memory stays bounded by `max_samples` plus one table's samples.
+    """
+    features, targets, priorities = [], [], []
+    rng = np.random.default_rng(seed)
+    default = profile_features({})
+    for table in tables:
+        users, user_codes = np.unique(table.user_ids, return_inverse=True)
+        user_codes = user_codes.ravel().astype(np.int64)
+        seconds = table.timestamps.astype(np.int64)
+        days = np.floor_divide(seconds, SECONDS_PER_DAY)
+        hours = np.floor_divide(seconds - days * SECONDS_PER_DAY, 3600)
+
+        span = int(days.max() - days.min()) + 1
+        keys, groups = np.unique(user_codes * span + (days - days.min()), return_inverse=True)
+        groups = groups.ravel()
+        n_groups = len(keys)
+        group_users = keys // span
+        group_days = keys % span + days.min()
+
+        # Cumulative intake and entry count at the end of each hour, per user-day
+        amounts_by_hour = np.bincount(groups * 24 + hours, weights=table.amounts,
+                                      minlength=n_groups * 24).reshape(n_groups, 24)
+        entries_by_hour = np.bincount(groups * 24 + hours,
+                                      minlength=n_groups * 24).reshape(n_groups, 24)
+        cumulative = np.cumsum(amounts_by_hour, axis=1)
+        cumulative_entries = np.cumsum(entries_by_hour, axis=1)
+        # Intake before the cut-off hour, i.e. up to the end of hour - 1
+        so_far = cumulative[:, TRAIN_HOURS - 1]
+        entries = cumulative_entries[:, TRAIN_HOURS - 1]
+        totals = cumulative[:, 23:24]
+
+        user_profiles = np.array([profiles.get(user, default) for user in users.tolist()],
+                                 dtype=np.float64)
+        n_hours = len(TRAIN_HOURS)
+        block = np.empty((n_groups, n_hours, len(FEATURES)))
+        block[:, :, 0] = TRAIN_HOURS
+        # Day 0 of the epoch was a Thursday; weekday 0 is Monday
+        block[:, :, 1] = ((group_days + 3) % 7)[:, None]
+        block[:, :, 2] = so_far
+        block[:, :, 3] = entries
+        block[:, :, 4:] = user_profiles[group_users][:, None, :]
+        features.append(block.reshape(-1, len(FEATURES)))
+        targets.append((totals - so_far).ravel())
+        if max_samples is None:
+            continue
+        priorities.append(rng.random(len(targets[-1])))
+        if len(features) > 1 or len(priorities[0]) > max_samples:
+            features, targets, priorities = _keep_lowest(features, targets, priorities, max_samples)
+
+    if not features:
+        return np.empty((0, len(FEATURES))), np.empty(0)
+    return np.concatenate(features), np.concatenate(targets)
+
+
+def _keep_lowest(features: List[np.ndarray], targets: List[np.ndarray],
+                 priorities: List[np.ndarray], max_samples: int) -> Tuple[List, List, List]:
+    """Merge the reservoir with the newest table's samples, keeping the lowest priorities."""
+    features, targets, priorities = (np.concatenate(features), np.concatenate(targets),
+                                     np.concatenate(priorities))
+    if len(priorities) > max_samples:
+        keep = np.argpartition(priorities, max_samples)[:max_samples]
+        features, targets, priorities = features[keep], targets[keep], priorities[keep]
+    return [features], [targets], [priorities]
+
+
+class IntakeForecaster:
+    """A trained scaler and model predicting end-of-day totals."""
+
+    def __init__(self, scaler, model, trained_at: Optional[str] = None, samples: int = 0):
+        self.scaler = scaler
+        self.model = model
+        self.trained_at = trained_at
+        self.samples = samples
+
+    @classmethod
+    def train(cls, features: np.ndarray, targets: np.ndarray, analyzer=None) -> 'IntakeForecaster':
+        from ai_analytics import WaterIntakeAnalyzer
+        analyzer = analyzer or WaterIntakeAnalyzer()
+        # Leaves of at least 20 samples keep the serialized forest compact
+        model = analyzer.model.set_params(min_samples_leaf=20, n_jobs=-1)
+        scaled = analyzer.scaler.fit_transform(features)
+        model.fit(scaled, targets)
+        model.set_params(n_jobs=1)
+        return cls(analyzer.scaler, model, datetime.now().isoformat(), len(targets))
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        import joblib
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Uncompressed so the arrays can be memory-mapped on load; written
+        # to a temp file and renamed so running workers never see a partial file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        joblib.dump({
+            'features': FEATURES,
+            'scaler': self.scaler,
+            'model': self.model,
+            'trained_at': self.trained_at,
+            'samples': self.samples
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> 'IntakeForecaster':
+        import joblib
+        bundle = joblib.load(path, mmap_mode='r')
+        if bundle['features'] != FEATURES:
+            raise ValueError(f'Forecast model at {path} was trained on different features')
+        return cls(bundle['scaler'], bundle['model'], bundle['trained_at'], bundle['samples'])
+
+    def predict_end_of_day(self, features: np.ndarray,
+                           batch_size: int = PREDICT_BATCH_SIZE) -> np.ndarray:
+        """Predicted end-of-day totals, one per feature row, in batches of `batch_size`."""
+        predictions = np.empty(len(features))
+        for start in range(0, len(features), batch_size):
+            batch = features[start:start + batch_size]
+            remaining = self.model.predict(self.scaler.transform(batch))
+            predictions[start:start + batch_size] = batch[:, 2] + np.maximum(remaining, 0)
+        return predictions
+
+
+_forecaster = None
+_forecaster_mtime = None
+_forecaster_lock = threading.Lock()
+
+
+def get_forecaster(path: str = MODEL_PATH) -> Optional[IntakeForecaster]:
+    """The process-wide forecaster, reloaded when the model file changes; None if untrained."""
+    global _forecaster, _forecaster_mtime
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _forecaster is None or mtime != _forecaster_mtime:
+        with _forecaster_lock:
+            if _forecaster is None or mtime != _forecaster_mtime:
+                try:
+                    _forecaster = IntakeForecaster.load(path)
+                    _forecaster_mtime = mtime
+                except Exception as e:
+                    print(f'Error loading forecast model: {str(e)}')
+                    return _forecaster
+    return _forecaster
+
+
+def forecast_today(db, phones: List[str], now: Optional[float] = None) -> Dict[str, Dict]:
+    """Today's intake so far, goal and predicted end-of-day total for each user.
+
+    "So far" means up to the start of the current hour, the same cut-off
+    build_training_set pairs with the hour feature; entries from the
+    partial current hour are left out of the features. Intake and profiles
+    are fetched with one query each and all users are predicted together.
+    Without a trained model the prediction is that intake, i.e. everyone
+    not yet at their goal is expected to miss it.
+    """
+    now = now if now is not None else time.time()
+    local = time.localtime(now)
+    today = time.strftime('%Y-%m-%d', local)
+    phones = list(dict.fromkeys(phones))
+    if not phones:
+        return {}
+
+    hour_start = int(now) - local.tm_min * 60 - local.tm_sec
+    counters = {
+        doc['_id']: doc for doc in db.water_intake_buckets.aggregate([
+            {'$match': {'phone': {'$in': phones}, 'date': today}},
+            {'$unwind': '$records'},
+            {'$match': {'records.t': {'$lt': hour_start}}},
+            {'$group': {'_id': '$phone', 'total_intake': {'$sum': '$records.a'},
+                        'record_count': {'$sum': 1}}}
+        ])
+    }
+    profiles = profile_cache.get_many(db, phones)
+
+    features = np.empty((len(phones), len(FEATURES)))
+    for i, phone in enumerate(phones):
+        counter = counters.get(phone, {})
+        features[i, :4] = (local.tm_hour, local.tm_wday,
+                           counter.get('total_intake', 0), counter.get('record_count', 0))
+        features[i, 4:] = profile_features(profiles.get(phone, {}))
+
+    forecaster = get_forecaster()
+    if forecaster is not None:
+        predicted = forecaster.predict_end_of_day(features)
+    else:
+        predicted = features[:, 2]
+
+    return {
+        phone: {
+            'intake_so_far': float(features[i, 2]),
+            'daily_goal': float(features[i, 7]),
+            'predicted_total': round(float(predicted[i]), 1),
+            'will_miss_goal': bool(predicted[i] < features[i, 7])
+        }
+        for i, phone in enumerate(phones)
+    }
+
+
+def users_likely_to_miss(db, phones: List[str], now: Optional[float] = None) -> List[str]:
+    """The subset of `phones` predicted to end the day below their goal."""
+    return [phone for phone, forecast in forecast_today(db, phones, now).items()
+            if forecast['will_miss_goal']]
+
+
+def train_from_db(db, days: int = 60, chunk_rows: int = 500_000,
+                  max_samples: int = 2_000_000, today: Optional[date] = None) -> IntakeForecaster:
+    """Train on the last `days` complete days of every user's entries."""
+    today = today or date.today()
+    start_date = (today - timedelta(days=days)).strftime('%Y-%m-%d')
+    end_date = (today - timedelta(days=1)).strftime('%Y-%m-%d')
+
+    profiles = {
+        profile['phone']: profile_features(profile)
+        for profile in db.users.find({}, PROFILE_PROJECTION).batch_size(5000)
+    }
+    rows = IntakeBuckets(db).iter_rows({'$exists': True}, start_date, end_date)
+    tables = user_chunks(IntakeTable.from_rows(rows, chunk_rows), chunk_rows)
+    features, targets = build_training_set(tables, profiles, max_samples)
+    if not len(targets):
+        raise ValueError('No intake entries to train on')
+    print(f'Training forecast model on {len(targets)} samples from {start_date}..{end_date}')
+    return IntakeForecaster.train(features, targets)
+
+
+def main() -> None:
+    from services.mongo_client import get_database
+
+    parser = argparse.ArgumentParser(description='Train the end-of-day intake forecast model')
+    parser.add_argument('--days', type=int, default=60, help='days of history to train on')
+    parser.add_argument('--max-samples', type=int, default=2_000_000)
+    parser.add_argument('--out', default=MODEL_PATH)
+    args = parser.parse_args()
+
+    db = get_database()
+    if db is None:
+        raise SystemExit('Database connection is not available')
+    started = time.time()
+    forecaster = train_from_db(db, args.days, max_samples=args.max_samples)
+    forecaster.save(args.out)
+    print(f'Saved forecast model to {args.out} in {time.time() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
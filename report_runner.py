@@ -0,0 +1,228 @@
+"""Nightly progress-report runner.
+
+Shards users into contiguous phone ranges and fans the shards out over a
+process pool. Each worker streams its shard's entries from MongoDB with
+one cursor per collection, runs the vectorized BatchAnalyticsEngine and
+bulk-upserts the reports into `progress_reports`. Finished shards are
+checkpointed in `report_runs`, so re-running the same period resumes
+where a crashed run stopped.
+
+    python report_runner.py --period week --workers 8
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from multiprocessing import get_context
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, UpdateOne
+
+from batch_analytics import DEFAULT_CHUNK_ROWS, BatchAnalyticsEngine, IntakeTable
+from services.intake_buckets import IntakeBuckets
+from services.intake_rollups import month_key, week_key
+from services.mongo_client import get_database
+from services.profile_cache import PROFILE_PROJECTION
+from services.recommendation import daily_goal_for
+
+load_dotenv()
+
+PERIOD_DAYS = {'week': 7, 'month': 30}
+PERIOD_KEYS = {'week': week_key, 'month': month_key}
+DEFAULT_SHARD_SIZE = int(os.getenv('REPORT_SHARD_SIZE', 2000))
+DEFAULT_WORKERS = int(os.getenv('REPORT_WORKERS', os.cpu_count() or 1))
+
+
+# Shards are inclusive phone ranges, planned once per run and stored with
+# the checkpoint so a resumed run works on exactly the same boundaries.
+Shard = Tuple[int, str, str]
+
+
+def plan_shards(db, shard_size: int) -> List[Shard]:
+    """Split all users, in phone order, into ranges of `shard_size` users."""
+    shards = []
+    first = last = None
+    count = 0
+    cursor = db.users.find({}, {'_id': 0, 'phone': 1}).sort('phone', ASCENDING).batch_size(5000)
+    for user in cursor:
+        if first is None:
+            first = user['phone']
+        last = user['phone']
+        count += 1
+        if count == shard_size:
+            shards.append((len(shards), first, last))
+            first, count = None, 0
+    if first is not None:
+        shards.append((len(shards), first, last))
+    return shards
+
+
+class ReportCheckpoint:
+    """Per-run shard plan and completed shards, stored in `report_runs`."""
+
+    def __init__(self, db, run_id: str):
+        self.collection = db.report_runs
+        self.run_id = run_id
+
+    def load_or_create(self, plan) -> Tuple[List[Shard], set]:
+        """Return the stored plan and finished shard ids, creating the run if new."""
+        run = self.collection.find_one({'_id': self.run_id})
+        if run is None:
+            shards = plan()
+            run = {
+                '_id': self.run_id,
+                'shards': [list(shard) for shard in shards],
+                'completed': [],
+                'started_at': datetime.now()
+            }
+            self.collection.insert_one(run)
+        shards = [tuple(shard) for shard in run['shards']]
+        return shards, set(run.get('completed', []))
+
+    def mark_done(self, shard_id: int, users: int, days: int) -> None:
+        self.collection.update_one(
+            {'_id': self.run_id},
+            {'$addToSet': {'completed': shard_id},
+             '$inc': {'users': users, 'days': days},
+             '$set': {'updated_at': datetime.now()}}
+        )
+
+    def finish(self) -> None:
+        self.collection.update_one({'_id': self.run_id}, {'$set': {'finished_at': datetime.now()}})
+
+    def reset(self) -> None:
+        self.collection.delete_one({'_id': self.run_id})
+
+
+def run_shard(run_id: str, shard: Shard, period: str, start_date: str,
+              period_key: str, chunk_rows: int) -> Dict:
+    """Worker entry point: build and store the reports for one shard."""
+    shard_id, first_phone, last_phone = shard
+    started = time.time()
+    # Each worker process opens its own client; MongoClient is not fork-safe
+    db = get_database()
+    if db is None:
+        raise ConnectionError('Database connection is not available')
+
+    phone_range = {'$gte': first_phone, '$lte': last_phone}
+    goals = {
+        profile['phone']: daily_goal_for(profile)
+        for profile in db.users.find({'phone': phone_range}, PROFILE_PROJECTION)
+    }
+
+    # Rows arrive sorted by phone, so each user's rows are contiguous,
+    # as analyze_stream requires
+    rows = IntakeBuckets(db).iter_rows(phone_range, start_date)
+    engine = BatchAnalyticsEngine(chunk_rows=chunk_rows)
+
+    users = days = 0
+    generated_at = datetime.now()
+    for metrics in engine.analyze_stream(IntakeTable.from_rows(rows, chunk_rows), goals):
+        operations = []
+        for phone, report in metrics.iter_reports(period):
+            operations.append(UpdateOne(
+                {'phone': phone, 'period': period, 'key': period_key},
+                {'$set': {**report, 'daily_goal': goals.get(phone, 0),
+                          'run_id': run_id, 'generated_at': generated_at}},
+                upsert=True
+            ))
+        if operations:
+            db.progress_reports.bulk_write(operations, ordered=False)
+        users += len(metrics)
+        days += int(metrics.days_logged.sum())
+
+    ReportCheckpoint(db, run_id).mark_done(shard_id, users, days)
+    return {'shard': shard_id, 'users': users, 'days': days,
+            'seconds': round(time.time() - started, 3)}
+
+
+class ReportRunner:
+    """Fans report shards out over a process pool and tracks progress."""
+
+    def __init__(self, db, period: str = 'week', workers: int = DEFAULT_WORKERS,
+                 shard_size: int = DEFAULT_SHARD_SIZE, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                 today: Optional[date] = None, run_id: Optional[str] = None):
+        if period not in PERIOD_DAYS:
+            raise ValueError(f'Unknown period: {period}')
+        self.db = db
+        self.period = period
+        self.workers = max(1, workers)
+        self.shard_size = shard_size
+        self.chunk_rows = chunk_rows
+        today = today or date.today()
+        self.start_date = (today - timedelta(days=PERIOD_DAYS[period] - 1)).strftime('%Y-%m-%d')
+        self.period_key = PERIOD_KEYS[period](today)
+        self.run_id = run_id or f'{period}:{today.isoformat()}'
+        self.checkpoint = ReportCheckpoint(db, self.run_id)
+
+    def run(self, restart: bool = False) -> Dict:
+        if restart:
+            self.checkpoint.reset()
+        shards, completed = self.checkpoint.load_or_create(
+            lambda: plan_shards(self.db, self.shard_size)
+        )
+        pending = [shard for shard in shards if shard[0] not in completed]
+        print(f'Report run {self.run_id}: {len(shards)} shards, '
+              f'{len(completed)} already done, {len(pending)} to go, {self.workers} workers')
+
+        started = time.time()
+        done = users = failed = 0
+        # spawn rather than fork: workers must not inherit the parent's client or threads
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn')) as pool:
+            futures = {
+                pool.submit(run_shard, self.run_id, shard, self.period,
+                            self.start_date, self.period_key, self.chunk_rows): shard
+                for shard in pending
+            }
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f'Shard {shard[0]} ({shard[1]}..{shard[2]}) failed: {str(e)}')
+                    continue
+                done += 1
+                users += result['users']
+                elapsed = time.time() - started
+                print(f'[{done + failed}/{len(pending)}] shard {result["shard"]}: '
+                      f'{result["users"]} users in {result["seconds"]}s '
+                      f'({users / elapsed:.0f} users/s overall)')
+
+        if not failed:
+            self.checkpoint.finish()
+        return {
+            'run_id': self.run_id,
+            'shards': len(shards),
+            'completed': len(completed) + done,
+            'failed': failed,
+            'users': users,
+            'seconds': round(time.time() - started, 3)
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate progress reports for all users')
+    parser.add_argument('--period', choices=sorted(PERIOD_DAYS), default='week')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--run-id', help='resume or name a specific run (default: period and date)')
+    parser.add_argument('--restart', action='store_true', help='discard the checkpoint and start over')
+    args = parser.parse_args()
+
+    db = get_database()
+    if db is None:
+        raise SystemExit('Database connection is not available')
+    runner = ReportRunner(db, args.period, args.workers, args.shard_size,
+                          args.chunk_rows, run_id=args.run_id)
+    summary = runner.run(restart=args.restart)
+    print(f'Report run finished: {summary}')
+    if summary['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
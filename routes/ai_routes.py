@@ -1,12 +1,48 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, url_for
 from services.ai_service import AIService
+from services.report_jobs import QueueFullError, ReportJobQueue
 from datetime import datetime, timedelta
+import os
+import threading
 
+# Not registered on the app yet: these endpoints take the user from query
+# parameters rather than the session token, so wiring them up (and putting
+# them behind token_required) is left to a separate change.
 ai_routes = Blueprint('ai_routes', __name__)
-ai_service = AIService()
+_ai_service = None
+_ai_service_lock = threading.Lock()
+
+
+def get_ai_service() -> AIService:
+    """Build the shared AIService on the first analytics request, not at import."""
+    global _ai_service
+    if _ai_service is None:
+        with _ai_service_lock:
+            if _ai_service is None:
+                _ai_service = AIService()
+    return _ai_service
+
+
+_report_jobs = None
+MAX_REPORT_WAIT = 5  # seconds a poll may hold a worker waiting for the result
+
+
+def get_report_jobs() -> ReportJobQueue:
+    """Bounded background queue for report generation (LLM calls take seconds)."""
+    global _report_jobs
+    if _report_jobs is None:
+        with _ai_service_lock:
+            if _report_jobs is None:
+                _report_jobs = ReportJobQueue(
+                    lambda *args: get_ai_service().generate_report(*args),
+                    max_workers=int(os.getenv('REPORT_JOB_WORKERS', 4)),
+                    max_pending=int(os.getenv('REPORT_JOB_MAX_PENDING', 100)),
+                    result_ttl=float(os.getenv('REPORT_JOB_RESULT_TTL', 600))
+                )
+    return _report_jobs
 
 @ai_routes.route('/api/analytics/report', methods=['GET'])
-async def get_analytics_report():
+def get_analytics_report():
     try:
         # Get user data from session
         user_data = {
@@ -15,6 +51,12 @@ async def get_analytics_report():
             'activity_level': request.args.get('activity_level', 'moderate')
         }
         
+        if not user_data['id']:
+            return jsonify({
+                'status': 'error',
+                'message': 'user_id is required'
+            }), 400
+        
         # Get water log data (implement actual database query)
         water_log = []  # Replace with actual water log data
         
@@ -25,19 +67,58 @@ async def get_analytics_report():
             'condition': 'sunny'
         }
         
-        # Generate AI report
-        report = await ai_service.generate_ai_report(user_data, water_log, weather_data)
+        # Generate the report in the background; the client polls for it.
+        # Only a request with the same user and inputs joins a job in flight.
+        dedup_key = (user_data['id'], user_data['daily_goal'], user_data['activity_level'])
+        job, created = get_report_jobs().submit(dedup_key, user_data, water_log, weather_data)
         
         return jsonify({
             'status': 'success',
-            'data': report
-        })
+            'data': {
+                **job.to_dict(),
+                'status_url': url_for('ai_routes.get_analytics_report_job', job_id=job.id),
+                'deduplicated': not created
+            }
+        }), 202
+    except QueueFullError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 503
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+@ai_routes.route('/api/analytics/report/<job_id>', methods=['GET'])
+def get_analytics_report_job(job_id):
+    job = get_report_jobs().get(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Report job not found or expired'
+        }), 404
+    
+    # ?wait=N long-polls for up to N seconds (capped) instead of returning at once
+    try:
+        wait = float(request.args.get('wait', 0) or 0)
+    except ValueError:
+        wait = -1
+    if not 0 <= wait < float('inf'):
+        return jsonify({
+            'status': 'error',
+            'message': 'wait must be a non-negative number of seconds'
+        }), 400
+    wait = min(wait, MAX_REPORT_WAIT)
+    if wait > 0 and not job.finished:
+        job.wait(wait)
+    
+    return jsonify({
+        'status': 'success',
+        'data': job.to_dict()
+    }), 200 if job.finished else 202
+
 @ai_routes.route('/api/analytics/insights', methods=['GET'])
 async def get_ai_insights():
     try:
@@ -48,7 +129,7 @@ async def get_ai_insights():
         water_log = []  # Replace with actual database query
         
         # Generate insights
-        analysis = ai_service.analyzer.analyze_intake_patterns(water_log)
+        analysis = get_ai_service().analyzer.analyze_intake_patterns(water_log)
         
         return jsonify({
             'status': 'success',
@@ -80,7 +161,7 @@ async def get_recommendations():
         }
         
         # Generate recommendations
-        recommendations = ai_service.analyzer.generate_personalized_recommendations(
+        recommendations = get_ai_service().analyzer.generate_personalized_recommendations(
             user_data, water_log, weather_data
         )
         
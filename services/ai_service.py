@@ -1,30 +1,39 @@
+import asyncio
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
-import openai
-
 from ai_analytics import WaterIntakeAnalyzer
 from config.ai_config import AIConfig
+from services.insight_cache import insight_cache, insight_key, summarize_for_prompt
+from services.llm_backends import get_llm_backend
+from services.mongo_client import get_database
 
 
 class AIService:
-    def __init__(self):
+    def __init__(self, db=None, llm_backend=None, cache=None):
         self.config = AIConfig()
+        self.db = db if db is not None else get_database()
         self.analyzer = WaterIntakeAnalyzer()
-        openai.api_key = self.config.get_openai_config()['api_key']
+        self.llm = llm_backend or get_llm_backend(self.config.get_openai_config())
+        self.insight_cache = cache or insight_cache
     
     async def generate_ai_report(self, user_data: Dict, water_log: List[Dict], weather_data: Dict) -> Dict:
-        """Generate a comprehensive AI-powered hydration report."""
+        """Async wrapper around generate_report that keeps the event loop free."""
+        return await asyncio.to_thread(self.generate_report, user_data, water_log, weather_data)
+    
+    def generate_report(self, user_data: Dict, water_log: List[Dict], weather_data: Dict) -> Dict:
+        """Generate a comprehensive AI-powered hydration report (blocking; run it off the request path)."""
         try:
-            # Get basic analytics
-            analysis = self.analyzer.analyze_intake_patterns(water_log)
+            # Get basic analytics; the log is parsed and aggregated once for all three
+            context = self.analyzer.build_context(water_log)
+            analysis = self.analyzer.analyze_intake_patterns(context)
             recommendations = self.analyzer.generate_personalized_recommendations(
-                user_data, water_log, weather_data
+                user_data, context, weather_data
             )
-            progress_report = self.analyzer.generate_progress_report(user_data, water_log)
+            progress_report = self.analyzer.generate_progress_report(user_data, context)
             
-            # Generate AI insights using OpenAI
-            insights = await self._generate_ai_insights(
+            # Generate AI insights with the configured LLM backend
+            insights = self._generate_ai_insights(
                 analysis, recommendations, progress_report
             )
             
@@ -38,44 +47,52 @@ class AIService:
             print(f"Error generating AI report: {str(e)}")
             return self._generate_error_report()
     
-    async def _generate_ai_insights(self, analysis: Dict, recommendations: Dict, progress: Dict) -> List[Dict]:
-        """Generate natural language insights using OpenAI."""
+    def _generate_ai_insights(self, analysis: Dict, recommendations: Dict, progress: Dict) -> List[Dict]:
+        """Generate natural language insights using the LLM backend."""
         try:
-            prompt = self._create_insight_prompt(analysis, recommendations, progress)
-            response = await openai.ChatCompletion.create(
-                model=self.config.get_openai_config()['model'],
-                messages=[
+            # The prompt only sees bucketed metrics, so every report with the
+            # same summary can share one completion
+            summary = summarize_for_prompt(analysis, recommendations, progress)
+            key = insight_key(summary, self.config.get_openai_config()['model'])
+            cached = self.insight_cache.get(key)
+            if cached is not None:
+                return cached
+            
+            prompt = self._create_insight_prompt(summary)
+            content = self.llm.complete(
+                [
                     {"role": "system", "content": "You are a hydration expert AI assistant."},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=self.config.get_openai_config()['max_tokens'],
-                temperature=self.config.get_openai_config()['temperature']
+                timeout=self.config.get_openai_config()['request_timeout']
             )
             
-            insights = self._parse_ai_response(response.choices[0].message['content'])
+            insights = self._parse_ai_response(content)
+            if insights:
+                self.insight_cache.set(key, insights)
             return insights
         except Exception as e:
             print(f"Error generating AI insights: {str(e)}")
             return self._generate_fallback_insights()
     
-    def _create_insight_prompt(self, analysis: Dict, recommendations: Dict, progress: Dict) -> str:
-        """Create a prompt for the AI model based on user data."""
+    def _create_insight_prompt(self, summary: Dict) -> str:
+        """Create a prompt for the AI model from the bucketed summary (see summarize_for_prompt)."""
         return f"""Based on the following hydration data, provide 3-5 key insights and actionable recommendations:
         
 Analysis:
-- Consistency Score: {analysis['consistency_score']}
-- Daily Average: {analysis['daily_average']}ml
-- Peak Hydration Hours: {', '.join(map(str, analysis['peak_hydration_hours']))}
+- Consistency Score: {summary['consistency_score']}
+- Daily Average: {summary['daily_average']}ml
+- Peak Hydration Hours: {', '.join(map(str, summary['peak_hydration_hours']))}
 
 Current Recommendations:
-- Base: {recommendations['base_recommendation']}ml
-- Weather Adjustment: {recommendations['weather_adjustment']}ml
-- Activity Adjustment: {recommendations['activity_adjustment']}ml
+- Base: {summary['base_recommendation']}ml
+- Weather Adjustment: {summary['weather_adjustment']}ml
+- Activity Adjustment: {summary['activity_adjustment']}ml
 
 Progress:
-- Goal Achievement Rate: {progress['goal_achievement_rate']}%
-- Current Streak: {progress['streak_data']['current_streak']} days
-- Best Streak: {progress['streak_data']['best_streak']} days
+- Goal Achievement Rate: {summary['goal_achievement_rate']}%
+- Current Streak: {summary['current_streak']} days
+- Best Streak: {summary['best_streak']} days
 
 Provide insights in a structured format with 'title' and 'description' for each insight."""
     
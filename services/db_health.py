@@ -0,0 +1,118 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class DatabaseHealthMonitor:
+    """Keeps a cached view of MongoDB health so requests never ping the server."""
+
+    def __init__(self, connect: Callable[[], Optional[object]],
+                 check_interval: float = 10.0,
+                 initial_backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self._connect = connect
+        self.check_interval = check_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self._db = None
+        self._healthy = False
+        self._last_error = None
+        self._last_check = None
+        self._backoff = initial_backoff
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def db(self):
+        """The current database handle (may be None before the first connect)."""
+        return self._db
+
+    def is_healthy(self) -> bool:
+        """Return the cached health state without touching the network."""
+        return self._healthy and self._db is not None
+
+    def add_listener(self, callback: Callable[[object], None]) -> None:
+        """Register a callback invoked with the db handle whenever it becomes healthy."""
+        self._listeners.append(callback)
+        if self.is_healthy():
+            self._notify(self._db)
+
+    def start(self) -> None:
+        """Run one connection attempt, then keep checking in a daemon thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._check()
+            self._thread = threading.Thread(
+                target=self._run, name='db-health-monitor', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread."""
+        self._stopped.set()
+        self._wake.set()
+
+    def request_check(self) -> None:
+        """Ask the monitor to re-check soon, e.g. after a query hit a network error."""
+        self._wake.set()
+
+    def status(self) -> Dict:
+        """Return a snapshot of the cached health state."""
+        return {
+            'healthy': self.is_healthy(),
+            'last_check': self._last_check,
+            'last_error': self._last_error,
+            'next_retry_in': None if self._healthy else self._backoff
+        }
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            delay = self.check_interval if self._healthy else self._backoff
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            self._check()
+
+    def _check(self) -> None:
+        was_healthy = self._healthy
+        try:
+            if self._db is None:
+                self._db = self._connect()
+                if self._db is None:
+                    raise ConnectionError('Unable to create database connection')
+            self._db.command('ping')
+        except Exception as e:
+            self._mark_unhealthy(e)
+        else:
+            self._healthy = True
+            self._last_error = None
+            self._backoff = self.initial_backoff
+            if not was_healthy:
+                print('Database connection is healthy')
+                self._notify(self._db)
+        finally:
+            self._last_check = time.time()
+
+    def _mark_unhealthy(self, error: Exception) -> None:
+        if self._healthy or self._last_error is None:
+            print(f'Database health check failed: {str(error)}')
+        self._healthy = False
+        self._last_error = str(error)
+        # Drop the handle so the next check goes through the reconnect path
+        self._db = None
+        # Exponential backoff between reconnect attempts
+        if self._last_check is not None:
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _notify(self, db) -> None:
+        for callback in self._listeners:
+            try:
+                callback(db)
+            except Exception as e:
+                print(f'Database health listener failed: {str(e)}')
@@ -0,0 +1,120 @@
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+
+# Indexes every deployment must have. All water_intake queries key on
+# {'phone', 'date'}; users are looked up by phone.
+INDEX_SPECS = {
+    'users': [
+        IndexModel([('phone', ASCENDING)], unique=True, name='phone_unique')
+    ],
+    'water_intake': [
+        IndexModel([('phone', ASCENDING), ('date', ASCENDING)], unique=True, name='phone_date_unique')
+    ],
+    'water_intake_buckets': [
+        IndexModel([('phone', ASCENDING), ('date', ASCENDING), ('count', ASCENDING)],
+                   name='phone_date_count')
+    ],
+    'water_rollups': [
+        IndexModel([('phone', ASCENDING), ('period', ASCENDING), ('key', ASCENDING)],
+                   unique=True, name='phone_period_key_unique')
+    ],
+    'progress_reports': [
+        IndexModel([('phone', ASCENDING), ('period', ASCENDING), ('key', ASCENDING)],
+                   unique=True, name='phone_period_key_unique')
+    ],
+    # One marker per (recipient, dedup key) claimed before a campaign send;
+    # removed by MongoDB once the key's scope has passed
+    'sms_sent': [
+        IndexModel([('phone', ASCENDING), ('dedup_key', ASCENDING)],
+                   unique=True, name='phone_dedup_key_unique'),
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0, name='expires_at_ttl')
+    ]
+}
+
+# Query shapes issued by the hot routes, used for explain-plan checks
+HOT_QUERIES = [
+    {'route': 'login/signup/user_profile', 'collection': 'users',
+     'filter': {'phone': '__explain__'}},
+    {'route': 'get_water_data/add_water_intake', 'collection': 'water_intake',
+     'filter': {'phone': '__explain__', 'date': '1970-01-01'}},
+    {'route': 'get_weekly_stats', 'collection': 'water_intake',
+     'filter': {'phone': '__explain__', 'date': {'$gte': '1970-01-01'}}},
+    {'route': 'get_weekly_stats', 'collection': 'water_rollups',
+     'filter': {'phone': '__explain__', 'period': 'all', 'key': 'all'}}
+]
+
+
+class IndexManager:
+    """Creates, verifies and explains the indexes behind the hot routes."""
+
+    def __init__(self, db, specs: Optional[Dict[str, List[IndexModel]]] = None):
+        self.db = db
+        self.specs = specs or INDEX_SPECS
+
+    def ensure_indexes(self) -> Dict:
+        """Create any missing indexes. Safe to run repeatedly."""
+        report = {}
+        for collection, models in self.specs.items():
+            try:
+                report[collection] = {
+                    'success': True,
+                    'indexes': self.db[collection].create_indexes(models)
+                }
+            except OperationFailure as e:
+                # Typically duplicate keys in existing data blocking a unique index
+                print(f'Failed to create indexes on {collection}: {str(e)}')
+                report[collection] = {'success': False, 'error': str(e)}
+        return report
+
+    def verify(self) -> Dict:
+        """Return which of the expected indexes exist on each collection."""
+        result = {}
+        for collection, models in self.specs.items():
+            existing = self.db[collection].index_information()
+            expected = [model.document['name'] for model in models]
+            result[collection] = {
+                'present': [name for name in expected if name in existing],
+                'missing': [name for name in expected if name not in existing]
+            }
+        return result
+
+    def explain_query(self, collection: str, filter: Dict) -> Dict:
+        """Explain a find and report whether the winning plan uses an index."""
+        plan = self.db[collection].find(filter).explain()
+        winning_plan = plan.get('queryPlanner', {}).get('winningPlan', {})
+        stages = []
+        index_names = []
+        self._walk_plan(winning_plan, stages, index_names)
+        return {
+            'stages': stages,
+            'indexes': index_names,
+            'index_covered': bool(index_names) and 'COLLSCAN' not in stages
+        }
+
+    def check_hot_queries(self) -> List[Dict]:
+        """Explain every hot route's query shape."""
+        results = []
+        for query in HOT_QUERIES:
+            try:
+                explained = self.explain_query(query['collection'], query['filter'])
+            except OperationFailure as e:
+                explained = {'error': str(e), 'index_covered': False}
+            results.append({'route': query['route'], 'collection': query['collection'], **explained})
+        return results
+
+    def _walk_plan(self, stage: Dict, stages: List[str], index_names: List[str]) -> None:
+        if not stage:
+            return
+        # Slot-based engine plans nest the classic plan under 'queryPlan'
+        if 'queryPlan' in stage:
+            stage = stage['queryPlan']
+        stages.append(stage.get('stage'))
+        if stage.get('indexName'):
+            index_names.append(stage['indexName'])
+        if 'inputStage' in stage:
+            self._walk_plan(stage['inputStage'], stages, index_names)
+        for child in stage.get('inputStages', []):
+            self._walk_plan(child, stages, index_names)
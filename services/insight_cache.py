@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from .cache import TTLCache
+
+
+# Bump when the prompt wording changes so old insights are not reused
+PROMPT_VERSION = 1
+
+# Granularity of each prompt metric. Reports inside the same buckets get
+# the same prompt, so the LLM answer for one serves them all.
+CONSISTENCY_STEP = 5
+ML_STEP = 100
+RATE_STEP = 5
+MAX_STREAK = 30
+
+
+def _bucket(value, step) -> int:
+    return int(round(float(value or 0) / step) * step)
+
+
+def summarize_for_prompt(analysis: Dict, recommendations: Dict, progress: Dict) -> Dict:
+    """The bucketed metrics an insight prompt is built from."""
+    streaks = progress['streak_data']
+    return {
+        'consistency_score': _bucket(analysis['consistency_score'], CONSISTENCY_STEP),
+        'daily_average': _bucket(analysis['daily_average'], ML_STEP),
+        'peak_hydration_hours': sorted(int(hour) for hour in analysis['peak_hydration_hours']),
+        'base_recommendation': _bucket(recommendations['base_recommendation'], ML_STEP),
+        'weather_adjustment': _bucket(recommendations['weather_adjustment'], ML_STEP),
+        'activity_adjustment': _bucket(recommendations['activity_adjustment'], ML_STEP),
+        'goal_achievement_rate': _bucket(progress['goal_achievement_rate'], RATE_STEP),
+        'current_streak': min(int(streaks['current_streak']), MAX_STREAK),
+        'best_streak': min(int(streaks['best_streak']), MAX_STREAK)
+    }
+
+
+def _age(path: str, now: float) -> float:
+    try:
+        return now - os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def insight_key(summary: Dict, model: str) -> str:
+    """Content address of a prompt summary: sha256 of its canonical JSON."""
+    payload = json.dumps({'v': PROMPT_VERSION, 'model': model, 'summary': summary},
+                         sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class InsightCache:
+    """Two-tier cache of generated insights keyed by insight_key.
+
+    The memory tier is a TTL/LRU cache per process; the optional disk tier
+    (one JSON file per key) is shared by all workers on the host and
+    survives restarts.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, maxsize: int = 5000, ttl: float = 86400, disk_dir: Optional[str] = None):
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+        self._writes = 0
+
+    @classmethod
+    def from_env(cls) -> 'InsightCache':
+        return cls(
+            maxsize=int(os.getenv('INSIGHT_CACHE_SIZE', 5000)),
+            ttl=float(os.getenv('INSIGHT_CACHE_TTL', 86400)),
+            disk_dir=os.getenv('INSIGHT_CACHE_DIR', '.insight_cache') or None
+        )
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        insights = self._memory.get(key)
+        if insights is not None:
+            self._count('memory_hits')
+            return insights
+        entry = self._read_disk(key)
+        if entry is not None:
+            self._count('disk_hits')
+            self._memory.set(key, entry['insights'], expires_at=entry['expires_at'])
+            return entry['insights']
+        self._count('misses')
+        return None
+
+    def set(self, key: str, insights: List[Dict]) -> None:
+        expires_at = time.time() + self.ttl
+        self._memory.set(key, insights, expires_at=expires_at)
+        if self.disk_dir:
+            self._write_disk(key, {'insights': insights, 'expires_at': expires_at})
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                'memory': self._memory.stats(),
+                'disk_enabled': bool(self.disk_dir),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'disk_errors': self.disk_errors,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+            }
+
+    def prune(self) -> int:
+        """Delete expired files from the disk tier; returns how many were removed."""
+        if not self.disk_dir:
+            return 0
+        removed = 0
+        now = time.time()
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        expired = json.load(f)['expires_at'] <= now
+                except (OSError, ValueError, KeyError):
+                    # Leftover temp file from a crashed writer (not one mid-write)
+                    expired = name.endswith('.tmp') and _age(path, now) > 60
+                if expired:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError:
+                        pass
+        return removed
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+    def _read_disk(self, key: str) -> Optional[Dict]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f'Insight cache read failed: {str(e)}')
+            self._count('disk_errors')
+            return None
+        if entry['expires_at'] <= time.time():
+            return None
+        return entry
+
+    def _write_disk(self, key: str, entry: Dict) -> None:
+        path = self._path(key)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            # Readers in other workers see either the old file or the new one
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f'Insight cache write failed: {str(e)}')
+            self._count('disk_errors')
+            return
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+insight_cache = InsightCache.from_env()
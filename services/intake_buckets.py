@@ -0,0 +1,136 @@
+import calendar
+import heapq
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+
+# Maximum intake entries stored in one bucket document
+BUCKET_SIZE = int(os.getenv('INTAKE_BUCKET_SIZE', 200))
+
+
+def make_record(amount: float, timestamp: Optional[float] = None, key: Optional[str] = None) -> Dict:
+    """Compact intake entry: epoch seconds, amount and, if given, its idempotency key."""
+    record = {'t': int(timestamp if timestamp is not None else time.time()), 'a': amount}
+    if key is not None:
+        record['k'] = key
+    return record
+
+
+def _utc_offset(date: str, offsets: Dict[str, int]) -> int:
+    # Bucket dates are local days; noon of the day gives that day's offset (DST-safe)
+    if date not in offsets:
+        noon = time.mktime(time.strptime(f'{date} 12:00:00', '%Y-%m-%d %H:%M:%S'))
+        offsets[date] = time.localtime(noon).tm_gmtoff
+    return offsets[date]
+
+
+class IntakeBuckets:
+    """Bounded storage for per-entry intake records in `water_intake_buckets`.
+
+    The per-day `water_intake` document only carries counters; the entries
+    themselves are appended to bucket documents holding at most
+    BUCKET_SIZE records each, spilling into a new bucket once one is full.
+    """
+
+    def __init__(self, db, bucket_size: int = BUCKET_SIZE):
+        self.db = db
+        self.collection = db.water_intake_buckets
+        self.bucket_size = bucket_size
+
+    def build_appends(self, phone: str, date: str, records: List[Dict]) -> List[UpdateOne]:
+        """Build the bucket writes appending `records` for one user-day."""
+        updates = []
+        for start in range(0, len(records), self.bucket_size):
+            chunk = records[start:start + self.bucket_size]
+            updates.append(UpdateOne(
+                # Only a bucket with room for the whole chunk matches; otherwise
+                # the upsert opens a fresh overflow bucket.
+                {'phone': phone, 'date': date, 'count': {'$lte': self.bucket_size - len(chunk)}},
+                {
+                    '$push': {'records': {'$each': chunk}},
+                    '$inc': {'count': len(chunk)},
+                    '$setOnInsert': {'created_at': time.time()}
+                },
+                upsert=True
+            ))
+        return updates
+
+    def append(self, phone: str, date: str, records: List[Dict]) -> None:
+        """Append records for one user-day."""
+        updates = self.build_appends(phone, date, records)
+        if updates:
+            self.collection.bulk_write(updates, ordered=True)
+
+    def iter_records(self, phone: str, start_date: str,
+                     end_date: Optional[str] = None) -> Iterator[Dict]:
+        """Stream a user's entries as {'timestamp': iso string, 'amount'} dicts.
+
+        Covers legacy inline `intake_records` arrays as well as buckets, so
+        callers never see how the entries are stored.
+        """
+        date_filter = {'$gte': start_date}
+        if end_date is not None:
+            date_filter['$lte'] = end_date
+        query = {'phone': phone, 'date': date_filter}
+
+        # Documents written before bucketing keep their entries inline
+        legacy = self.db.water_intake.find(
+            {**query, 'intake_records.0': {'$exists': True}},
+            {'_id': 0, 'date': 1, 'intake_records': 1}
+        ).sort('date', ASCENDING)
+        for doc in legacy:
+            for record in doc['intake_records']:
+                yield self._decode(record, doc['date'])
+
+        buckets = self.collection.find(
+            query, {'_id': 0, 'date': 1, 'records': 1}
+        ).sort([('date', ASCENDING), ('_id', ASCENDING)]).batch_size(50)
+        for bucket in buckets:
+            for record in bucket['records']:
+                yield self._decode(record, bucket['date'])
+
+    def iter_rows(self, phone_filter, start_date: str,
+                  end_date: Optional[str] = None) -> Iterator[Tuple[str, int, float]]:
+        """Stream (phone, wall-clock epoch seconds, amount) rows for many users, sorted by phone.
+
+        `phone_filter` is any query on phone (e.g. a range or `$in`). Bucket
+        and legacy entries are merged, so each user's rows are contiguous.
+        """
+        date_filter = {'$gte': start_date}
+        if end_date is not None:
+            date_filter['$lte'] = end_date
+        query = {'phone': phone_filter, 'date': date_filter}
+        return heapq.merge(self._legacy_rows(query), self._bucket_rows(query),
+                           key=lambda row: row[0])
+
+    def _bucket_rows(self, query: Dict) -> Iterator[Tuple[str, int, float]]:
+        offsets = {}
+        cursor = self.collection.find(
+            query, {'_id': 0, 'phone': 1, 'date': 1, 'records': 1}
+        ).sort([('phone', ASCENDING), ('date', ASCENDING), ('_id', ASCENDING)]).batch_size(500)
+        for bucket in cursor:
+            offset = _utc_offset(bucket['date'], offsets)
+            for record in bucket['records']:
+                yield bucket['phone'], record['t'] + offset, record['a']
+
+    def _legacy_rows(self, query: Dict) -> Iterator[Tuple[str, int, float]]:
+        cursor = self.db.water_intake.find(
+            {**query, 'intake_records.0': {'$exists': True}},
+            {'_id': 0, 'phone': 1, 'date': 1, 'intake_records': 1}
+        ).sort([('phone', ASCENDING), ('date', ASCENDING)]).batch_size(500)
+        for doc in cursor:
+            midnight = calendar.timegm(time.strptime(doc['date'], '%Y-%m-%d'))
+            for record in doc['intake_records']:
+                hours, minutes, seconds = record['timestamp'].split(':')
+                yield doc['phone'], midnight + int(hours) * 3600 + int(minutes) * 60 + int(seconds), record['amount']
+
+    def _decode(self, record: Dict, date: str) -> Dict:
+        if 't' in record:
+            timestamp = datetime.fromtimestamp(record['t'])
+            return {'timestamp': timestamp.isoformat(), 'amount': record['a']}
+        # Legacy entry: {'amount', 'timestamp': '%H:%M:%S'} within the day's date
+        return {'timestamp': f"{date}T{record['timestamp']}", 'amount': record['amount']}
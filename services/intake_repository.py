@@ -0,0 +1,88 @@
+from typing import Dict, Iterable, List, Optional
+
+from .profile_cache import PROFILE_PROJECTION, profile_cache
+from .recommendation import daily_goal_for
+
+
+class IntakeRepository:
+    """Query helpers for the water_intake collection and its user lookups."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_dashboard_intake(self, phone: str, today: str, yesterday: str) -> Optional[Dict]:
+        """Fetch today's and yesterday's totals plus the recommended intake in one round trip.
+
+        With the profile cached this is a single water_intake query; on a
+        miss one aggregation returns the profile (which is then cached)
+        together with both totals. The recommended intake is the profile's
+        precomputed daily_goal. Returns None when no user exists.
+        """
+        profile = profile_cache.peek(phone)
+        if profile is not None:
+            totals = self.get_intake_totals(phone, [today, yesterday])
+        else:
+            pipeline = [
+                {'$match': {'phone': phone}},
+                {'$limit': 1},
+                {'$project': PROFILE_PROJECTION},
+                {'$lookup': {
+                    'from': 'water_intake',
+                    'pipeline': [
+                        {'$match': {'phone': phone, 'date': {'$in': [today, yesterday]}}},
+                        {'$project': {'_id': 0, 'date': 1, 'total_intake': 1}}
+                    ],
+                    'as': 'intake'
+                }}
+            ]
+            result = next(self.db.users.aggregate(pipeline), None)
+            if result is None:
+                return None
+
+            totals = {doc['date']: doc.get('total_intake', 0) for doc in result.pop('intake')}
+            profile = result
+            profile_cache.put(phone, profile)
+
+        return {
+            'today_intake': totals.get(today, 0),
+            'yesterday_intake': totals.get(yesterday, 0),
+            'recommended_intake': daily_goal_for(profile)
+        }
+
+    def get_intake_totals(self, phone: str, dates: Iterable[str]) -> Dict[str, float]:
+        """Return {date: total_intake} for the given days with one indexed query."""
+        return {
+            doc['date']: doc.get('total_intake', 0)
+            for doc in self.db.water_intake.find(
+                {'phone': phone, 'date': {'$in': list(dates)}},
+                {'_id': 0, 'date': 1, 'total_intake': 1}
+            )
+        }
+
+    def get_daily_totals(self, phone: str, start_date: str) -> List[Dict]:
+        """Return per-day intake totals since start_date, newest first.
+
+        Sums the pre-aggregated total_intake field server-side, so the
+        per-entry intake_records arrays are never transferred.
+        """
+        pipeline = [
+            {'$match': {'phone': phone, 'date': {'$gte': start_date}}},
+            {'$group': {'_id': '$date', 'total': {'$sum': '$total_intake'}}},
+            {'$match': {'total': {'$gt': 0}}},
+            {'$sort': {'_id': -1}}
+        ]
+        return [
+            {'date': doc['_id'], 'total': doc['total']}
+            for doc in self.db.water_intake.aggregate(pipeline)
+        ]
+
+    def get_daily_goal(self, phone: str) -> float:
+        """Return the user's stored daily goal (computed for profiles saved before goals were stored)."""
+        return self.get_daily_goals([phone]).get(phone, 0)
+
+    def get_daily_goals(self, phones) -> Dict[str, float]:
+        """Return daily goals for several users, served from the profile cache where possible."""
+        return {
+            phone: daily_goal_for(profile)
+            for phone, profile in profile_cache.get_many(self.db, phones).items()
+        }
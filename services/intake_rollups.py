@@ -0,0 +1,219 @@
+import time
+from datetime import date as date_type, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+from .intake_buckets import IntakeBuckets
+
+
+def week_key(day: date_type) -> str:
+    """ISO week bucket key, e.g. '2026-W42' (weeks start on Monday)."""
+    year, week, _ = day.isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def month_key(day: date_type) -> str:
+    """Calendar month bucket key, e.g. '2026-10'."""
+    return f'{day.year}-{day.month:02d}'
+
+
+class IntakeRollups:
+    """Per-user weekly, monthly and lifetime intake rollups in `water_rollups`.
+
+    Buckets are updated incrementally alongside each intake write, so
+    dashboards and reports read a handful of small documents regardless of
+    how long a user's history is.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.water_rollups
+
+    def build_updates(self, phone: str, day: date_type, amount: float,
+                      day_total: float, daily_goal: float,
+                      hours: Optional[Dict[int, float]] = None) -> list:
+        """Build the rollup writes for `amount` added to `day`.
+
+        `day_total` is the day's total after the write; `hours` maps
+        hour-of-day to amount (defaults to the whole amount in one hour
+        bucket of the current time).
+        """
+        previous_total = day_total - amount
+        new_day = 1 if previous_total <= 0 else 0
+        goal_hit = 1 if daily_goal > 0 and previous_total < daily_goal <= day_total else 0
+        if hours is None:
+            hours = {time.localtime().tm_hour: amount}
+
+        bucket_inc = {'total': amount, 'days_logged': new_day, 'goal_hits': goal_hit}
+        for hour, hour_amount in hours.items():
+            bucket_inc[f'hours.{hour}'] = hour_amount
+
+        updates = [
+            UpdateOne(
+                {'phone': phone, 'period': period, 'key': key},
+                {
+                    '$inc': bucket_inc,
+                    '$max': {'best_day': day_total},
+                    '$set': {'updated_at': time.time()}
+                },
+                upsert=True
+            )
+            for period, key in (('week', week_key(day)), ('month', month_key(day)))
+        ]
+        updates.append(self._lifetime_update(phone, day, amount, new_day, goal_hit))
+        return updates
+
+    def _lifetime_update(self, phone: str, day: date_type, amount: float,
+                         new_day: int, goal_hit: int) -> UpdateOne:
+        today = day.isoformat()
+        yesterday = (day - timedelta(days=1)).isoformat()
+        current_streak = {'$ifNull': ['$current_streak', 0]}
+        # Pipeline update so the streak is derived from the stored
+        # last_active_date atomically, without a read-modify-write.
+        return UpdateOne(
+            {'phone': phone, 'period': 'all', 'key': 'all'},
+            [
+                {'$set': {
+                    'current_streak': {'$switch': {
+                        'branches': [
+                            {'case': {'$eq': ['$last_active_date', today]}, 'then': current_streak},
+                            {'case': {'$eq': ['$last_active_date', yesterday]},
+                             'then': {'$add': [current_streak, 1]}},
+                            # Late (backfilled) entries leave the running streak alone
+                            {'case': {'$lt': [today, '$last_active_date']}, 'then': current_streak}
+                        ],
+                        'default': 1
+                    }},
+                    'total': {'$add': [{'$ifNull': ['$total', 0]}, amount]},
+                    'days_logged': {'$add': [{'$ifNull': ['$days_logged', 0]}, new_day]},
+                    'goal_hits': {'$add': [{'$ifNull': ['$goal_hits', 0]}, goal_hit]},
+                    'last_active_date': {'$max': [{'$ifNull': ['$last_active_date', today]}, today]},
+                    'updated_at': time.time()
+                }},
+                {'$set': {
+                    'best_streak': {'$max': [{'$ifNull': ['$best_streak', 0]}, '$current_streak']}
+                }}
+            ],
+            upsert=True
+        )
+
+    def record_intake(self, phone: str, day: date_type, amount: float,
+                      day_total: float, daily_goal: float) -> None:
+        """Apply the rollup writes for one intake entry in a single bulk write."""
+        self.apply_updates(
+            [(phone, self.build_updates(phone, day, amount, day_total, daily_goal))],
+            {phone: daily_goal}, ordered=False
+        )
+
+    def apply_updates(self, entries: List[Tuple[str, List[UpdateOne]]],
+                      daily_goals: Dict[str, float], ordered: bool = True) -> None:
+        """Run (phone, build_updates(...)) writes in one bulk write.
+
+        A user whose lifetime document one of these writes created has
+        no rollups for earlier history yet, so theirs are rebuilt from
+        water_intake (which already holds the new entries).
+        """
+        updates, lifetime_phones = [], {}
+        for phone, phone_updates in entries:
+            updates.extend(phone_updates)
+            # build_updates puts the lifetime update last
+            lifetime_phones[len(updates) - 1] = phone
+        result = self.collection.bulk_write(updates, ordered=ordered)
+        created = {lifetime_phones[index] for index in result.upserted_ids if index in lifetime_phones}
+        for phone in created:
+            self.rebuild(phone, daily_goals.get(phone, 0))
+
+    def get_summary(self, phone: str, day: date_type) -> Optional[Dict]:
+        """Fetch the current week, month and lifetime rollups in one query.
+
+        Returns None when the user has no rollups yet or their backfill
+        has not finished, so callers fall back to the raw history.
+        """
+        docs = self.collection.find(
+            {'phone': phone, '$or': [
+                {'period': 'week', 'key': week_key(day)},
+                {'period': 'month', 'key': month_key(day)},
+                {'period': 'all', 'key': 'all'}
+            ]},
+            {'_id': 0}
+        )
+        summary = {doc['period']: doc for doc in docs}
+        lifetime = summary.get('all')
+        if lifetime is None or 'backfill' in lifetime:
+            return None
+
+        # A streak only counts as current if it reaches today or yesterday
+        last_active = lifetime.get('last_active_date')
+        if last_active not in (day.isoformat(), (day - timedelta(days=1)).isoformat()):
+            lifetime['current_streak'] = 0
+
+        return {
+            'week': summary.get('week', {}),
+            'month': summary.get('month', {}),
+            'all': lifetime
+        }
+
+    def rebuild(self, phone: str, daily_goal: float) -> None:
+        """Recompute a user's rollups from their full history.
+
+        apply_updates runs this when a write creates the user's lifetime
+        document, so users whose history predates rollups (or whose earlier
+        backfill failed) do not start from an empty lifetime. While it runs
+        the lifetime document carries a `backfill` marker, and get_summary
+        treats the user as having no rollups. A failed rebuild removes the
+        partial rollups, so the next write retries it.
+        """
+        try:
+            for _ in range(2):
+                self._reset(phone)
+                self._apply_history(phone, daily_goal)
+                # A concurrent write can land both in the history read and
+                # as an incremental update; if so, recompute once more
+                if self._matches_history(phone):
+                    break
+            self.collection.update_one(
+                {'phone': phone, 'period': 'all', 'key': 'all'},
+                {'$unset': {'backfill': ''}}
+            )
+        except Exception:
+            self.collection.delete_many({'phone': phone})
+            raise
+
+    def _reset(self, phone: str) -> None:
+        self.collection.replace_one(
+            {'phone': phone, 'period': 'all', 'key': 'all'},
+            {'phone': phone, 'period': 'all', 'key': 'all', 'backfill': 'pending', 'updated_at': time.time()},
+            upsert=True
+        )
+        self.collection.delete_many({'phone': phone, 'period': {'$ne': 'all'}})
+
+    def _matches_history(self, phone: str) -> bool:
+        lifetime = self.collection.find_one({'phone': phone, 'period': 'all', 'key': 'all'},
+                                            {'_id': 0, 'total': 1}) or {}
+        history = list(self.db.water_intake.aggregate([
+            {'$match': {'phone': phone, 'total_intake': {'$gt': 0}}},
+            {'$group': {'_id': None, 'total': {'$sum': '$total_intake'}}}
+        ]))
+        return abs(lifetime.get('total', 0) - (history[0]['total'] if history else 0)) < 1e-6
+
+    def _apply_history(self, phone: str, daily_goal: float) -> None:
+        # Hour-of-day histogram per day, from the stored entries
+        hours_by_day = {}
+        for record in IntakeBuckets(self.db).iter_records(phone, '0000-01-01'):
+            day_hours = hours_by_day.setdefault(record['timestamp'][:10], {})
+            hour = int(record['timestamp'][11:13])
+            day_hours[hour] = day_hours.get(hour, 0) + record['amount']
+
+        days = self.db.water_intake.find(
+            {'phone': phone, 'total_intake': {'$gt': 0}},
+            {'_id': 0, 'date': 1, 'total_intake': 1}
+        ).sort('date', ASCENDING)
+        updates = []
+        for doc in days:
+            day = date_type.fromisoformat(doc['date'])
+            updates.extend(self.build_updates(phone, day, doc['total_intake'], doc['total_intake'],
+                                              daily_goal, hours=hours_by_day.get(doc['date'], {})))
+        if updates:
+            # Ordered, so the lifetime streak sees the days in sequence
+            self.collection.bulk_write(updates, ordered=True)
@@ -0,0 +1,316 @@
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .intake_buckets import IntakeBuckets, make_record
+from .intake_repository import IntakeRepository
+from .intake_rollups import IntakeRollups
+
+
+MAX_BATCH_EVENTS = 500
+# How far back an offline client may backfill, and clock skew allowed into the future
+MAX_EVENT_AGE_SECONDS = 30 * 86400
+MAX_EVENT_SKEW_SECONDS = 300
+# Idempotency keys remembered per user-day document
+MAX_APPLIED_KEYS = 1000
+# Rounds of counter upserts before giving up on user-days that keep colliding
+COUNTER_WRITE_ATTEMPTS = 3
+
+
+def validate_events(raw_events, now: Optional[float] = None,
+                    batch_key: Optional[str] = None) -> Tuple[List[Dict], List[Dict]]:
+    """Validate a batch of intake events.
+
+    Each event is {'amount', 'timestamp' (ISO string or epoch seconds,
+    optional), 'id' (idempotency key, optional)}. When the request carries a
+    batch-level key, events without an id get '<batch_key>:<index>'.
+    Returns (valid events, rejections as {'index', 'error'}).
+    """
+    now = now if now is not None else time.time()
+    valid, rejected = [], []
+    if not isinstance(raw_events, list):
+        return valid, [{'index': None, 'error': 'events must be a list'}]
+    if len(raw_events) > MAX_BATCH_EVENTS:
+        return valid, [{'index': None, 'error': f'At most {MAX_BATCH_EVENTS} events per batch'}]
+
+    seen_keys = set()
+    for index, event in enumerate(raw_events):
+        if not isinstance(event, dict):
+            rejected.append({'index': index, 'error': 'Event must be an object'})
+            continue
+
+        amount = event.get('amount')
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0:
+            rejected.append({'index': index, 'error': 'Invalid amount provided'})
+            continue
+
+        timestamp = event.get('timestamp', now)
+        try:
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp).timestamp()
+            elif isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+                raise ValueError
+        except ValueError:
+            rejected.append({'index': index, 'error': 'Invalid timestamp'})
+            continue
+        if timestamp > now + MAX_EVENT_SKEW_SECONDS or timestamp < now - MAX_EVENT_AGE_SECONDS:
+            rejected.append({'index': index, 'error': 'Timestamp out of accepted range'})
+            continue
+
+        key = event.get('id')
+        if key is None and batch_key:
+            key = f'{batch_key}:{index}'
+        if key is not None:
+            if not isinstance(key, str) or not key or len(key) > 128:
+                rejected.append({'index': index, 'error': 'Invalid idempotency key'})
+                continue
+            if key in seen_keys:
+                # Repeated within the same batch: keep the first occurrence
+                continue
+            seen_keys.add(key)
+
+        valid.append({'amount': amount, 'timestamp': float(timestamp), 'key': key})
+    return valid, rejected
+
+
+class IntakeWriter:
+    """Writes intake entries to day counters, buckets and rollups."""
+
+    def __init__(self, db):
+        self.db = db
+        self.repository = IntakeRepository(db)
+        self.buckets = IntakeBuckets(db)
+        self.rollups = IntakeRollups(db)
+
+    def record(self, phone: str, amount: float, timestamp: Optional[float] = None) -> float:
+        """Record a single entry and return the day's new total."""
+        now = timestamp if timestamp is not None else time.time()
+        today = time.strftime('%Y-%m-%d', time.localtime(now))
+
+        # Append the entry to a bounded bucket document
+        self.buckets.append(phone, today, [make_record(amount, now)])
+
+        # Update or create the per-day counters for today
+        result = self.db.water_intake.find_one_and_update(
+            {'phone': phone, 'date': today},
+            {
+                '$inc': {'total_intake': amount, 'record_count': 1},
+                '$setOnInsert': {'created_at': now}
+            },
+            projection={'_id': 0, 'total_intake': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        # Keep the weekly/monthly/lifetime rollups in step with the new total.
+        # The intake itself is already stored, so a failure here is logged
+        # rather than raised (a client retry would double count).
+        try:
+            self.rollups.record_intake(
+                phone, datetime.strptime(today, '%Y-%m-%d').date(), amount,
+                result['total_intake'], self.repository.get_daily_goal(phone)
+            )
+        except Exception as e:
+            print(f'Error updating intake rollups: {str(e)}')
+        return result['total_intake']
+
+    def record_batch(self, events: List[Dict]) -> Dict:
+        """Apply validated events ({'phone', 'amount', 'timestamp', 'key'}) in bulk.
+
+        Events are grouped per (phone, date), with one counter upsert per
+        group (returning the day's total before it, which keeps rollups
+        exact under concurrent writers) and one bulk write of bucket
+        appends for the whole batch. Duplicates are detected per idempotency key: events whose
+        key was already applied to their day are dropped and the rest of
+        the group is still applied, so a retried batch may be merged with
+        new events. Returns {'accepted', 'duplicates'} event counts.
+        """
+        groups = {}
+        for event in events:
+            date = time.strftime('%Y-%m-%d', time.localtime(event['timestamp']))
+            groups.setdefault((event['phone'], date), []).append(event)
+        if not groups:
+            return {'accepted': 0, 'duplicates': 0}
+
+        applied, duplicates = {}, {}
+        # Each applied group's day total just before its own increment
+        previous_totals = {}
+        remaining = groups
+        for _ in range(COUNTER_WRITE_ATTEMPTS):
+            fresh = self._drop_applied(remaining, duplicates)
+            if not fresh:
+                remaining = {}
+                break
+            group_keys = list(fresh)
+            # The $nin guard still rejects a group if another writer applied
+            # one of its keys since the check; two writers creating the same
+            # new day also collide on the index. Both are rechecked.
+            collided = self._apply_counters(fresh, previous_totals)
+            for key in group_keys:
+                if key not in collided:
+                    applied[key] = fresh[key]
+            remaining = {key: fresh[key] for key in collided}
+            if not remaining:
+                break
+        if remaining:
+            raise RuntimeError(f'Intake counters for {len(remaining)} user-days kept colliding; retry the batch')
+
+        # Entries whose counters were applied by an earlier attempt that failed
+        # before writing their bucket records still need those records.
+        repaired = self._missing_bucket_records(duplicates)
+        to_bucket = {key: applied.get(key, []) + repaired.get(key, [])
+                     for key in set(applied) | set(repaired)}
+        if to_bucket:
+            bucket_updates = []
+            for (phone, date), group in to_bucket.items():
+                records = [make_record(e['amount'], e['timestamp'], e['key']) for e in group]
+                bucket_updates.extend(self.buckets.build_appends(phone, date, records))
+            self.buckets.collection.bulk_write(bucket_updates, ordered=True)
+
+            try:
+                self._update_rollups(to_bucket, applied, previous_totals)
+            except Exception as e:
+                print(f'Error updating intake rollups: {str(e)}')
+
+        return {
+            'accepted': sum(len(group) for group in applied.values()),
+            'duplicates': sum(len(group) for group in duplicates.values())
+        }
+
+    def _drop_applied(self, groups: Dict, duplicates: Dict) -> Dict:
+        """Split off events whose keys their day already holds; return the rest by group."""
+        keyed = [(phone, date) for (phone, date), group in groups.items()
+                 if any(e['key'] for e in group)]
+        stored = {}
+        if keyed:
+            for doc in self.db.water_intake.find(
+                {'$or': [
+                    {'phone': phone, 'date': date,
+                     'applied_keys': {'$in': [e['key'] for e in groups[(phone, date)] if e['key']]}}
+                    for phone, date in keyed
+                ]},
+                {'_id': 0, 'phone': 1, 'date': 1, 'applied_keys': 1}
+            ):
+                stored[(doc['phone'], doc['date'])] = set(doc.get('applied_keys', []))
+
+        fresh = {}
+        for group_key, group in groups.items():
+            applied_keys = stored.get(group_key, ())
+            for event in group:
+                target = duplicates if event['key'] in applied_keys else fresh
+                target.setdefault(group_key, []).append(event)
+        return fresh
+
+    def _apply_counters(self, groups: Dict, previous_totals: Dict) -> set:
+        """Increment each group's day counters; return the groups whose upsert collided.
+
+        One find_one_and_update per group returns the document as it was
+        before that group's increment, so concurrent writers to the same
+        day each see their own previous total. The totals are stored in
+        `previous_totals` (0 for a day this write created).
+        """
+        collided = set()
+        for (phone, date), group in groups.items():
+            query, update = self._counter_update(phone, date, group)
+            try:
+                before = self.db.water_intake.find_one_and_update(
+                    query, update,
+                    projection={'_id': 0, 'total_intake': 1},
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+            except DuplicateKeyError:
+                # A guarded upsert that matches nothing tries to insert a
+                # second (phone, date) document and hits the unique index.
+                collided.add((phone, date))
+                continue
+            previous_totals[(phone, date)] = (before or {}).get('total_intake', 0)
+        return collided
+
+    def _missing_bucket_records(self, duplicates: Dict) -> Dict:
+        """Duplicate events counted in water_intake but absent from the buckets."""
+        if not duplicates:
+            return {}
+        group_keys = list(duplicates)
+        record_counts = {
+            (doc['phone'], doc['date']): doc.get('record_count', 0)
+            for doc in self.db.water_intake.find(
+                {'$or': [{'phone': phone, 'date': date} for phone, date in group_keys]},
+                {'_id': 0, 'phone': 1, 'date': 1, 'record_count': 1}
+            )
+        }
+        bucketed, bucketed_keys = {}, {}
+        for bucket in self.buckets.collection.find(
+            {'$or': [{'phone': phone, 'date': date} for phone, date in group_keys]},
+            {'_id': 0, 'phone': 1, 'date': 1, 'count': 1, 'records.k': 1}
+        ):
+            group_key = (bucket['phone'], bucket['date'])
+            bucketed[group_key] = bucketed.get(group_key, 0) + bucket.get('count', 0)
+            bucketed_keys.setdefault(group_key, set()).update(
+                record['k'] for record in bucket.get('records', []) if 'k' in record
+            )
+
+        repaired = {}
+        for group_key, group in duplicates.items():
+            # Only a day whose counters are ahead of its buckets can be missing records
+            missing = record_counts.get(group_key, 0) - bucketed.get(group_key, 0)
+            for event in group:
+                if missing <= 0:
+                    break
+                if event['key'] not in bucketed_keys.get(group_key, ()):
+                    repaired.setdefault(group_key, []).append(event)
+                    missing -= 1
+        return repaired
+
+    def _counter_update(self, phone: str, date: str, group: List[Dict]) -> Tuple[Dict, Dict]:
+        keys = [event['key'] for event in group if event['key'] is not None]
+        query = {'phone': phone, 'date': date}
+        update = {
+            '$inc': {
+                'total_intake': sum(event['amount'] for event in group),
+                'record_count': len(group)
+            },
+            '$setOnInsert': {'created_at': time.time()}
+        }
+        if keys:
+            query['applied_keys'] = {'$nin': keys}
+            update['$push'] = {'applied_keys': {'$each': keys, '$slice': -MAX_APPLIED_KEYS}}
+        return query, update
+
+    def _update_rollups(self, groups: Dict, applied: Dict, previous_totals: Dict) -> None:
+        # Repaired groups applied their counters in an earlier attempt, so
+        # their totals are read back; applied groups use the total their
+        # own increment returned.
+        unknown = [key for key in groups if key not in previous_totals]
+        current = {}
+        if unknown:
+            current = {
+                (doc['phone'], doc['date']): doc.get('total_intake', 0)
+                for doc in self.db.water_intake.find(
+                    {'$or': [{'phone': phone, 'date': date} for phone, date in unknown]},
+                    {'_id': 0, 'phone': 1, 'date': 1, 'total_intake': 1}
+                )
+            }
+        goals = self.repository.get_daily_goals({phone for phone, _ in groups})
+
+        entries = []
+        # Oldest day first so each user's streak advances in order
+        for phone, date in sorted(groups, key=lambda key: key[1]):
+            group = groups[(phone, date)]
+            hours = {}
+            for event in group:
+                hour = time.localtime(event['timestamp']).tm_hour
+                hours[hour] = hours.get(hour, 0) + event['amount']
+            if (phone, date) in previous_totals:
+                day_total = previous_totals[(phone, date)] + sum(e['amount'] for e in applied[(phone, date)])
+            else:
+                day_total = current.get((phone, date), 0)
+            entries.append((phone, self.rollups.build_updates(
+                phone, datetime.strptime(date, '%Y-%m-%d').date(),
+                sum(event['amount'] for event in group),
+                day_total, goals.get(phone, 0), hours=hours
+            )))
+        self.rollups.apply_updates(entries, goals)
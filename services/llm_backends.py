@@ -0,0 +1,64 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+
+class OpenAIBackend:
+    """Chat completions through the openai package (imported on first use)."""
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self._openai = None
+
+    def _client(self):
+        if self._openai is None:
+            import openai
+            openai.api_key = self.config['api_key']
+            self._openai = openai
+        return self._openai
+
+    def complete(self, messages: List[Dict], timeout: Optional[float] = None) -> str:
+        response = self._client().ChatCompletion.create(
+            model=self.config['model'],
+            messages=messages,
+            max_tokens=self.config['max_tokens'],
+            temperature=self.config['temperature'],
+            request_timeout=timeout
+        )
+        return response.choices[0].message['content']
+
+
+class FakeLLMBackend:
+    """Canned completions with configurable latency, for local runs and load tests."""
+
+    DEFAULT_RESPONSE = (
+        'Title: Keep a steady rhythm\n'
+        'Description: Spread your intake evenly across the day instead of catching up at night.\n'
+        'Title: Start early\n'
+        'Description: A glass of water within an hour of waking makes the daily goal easier to reach.\n'
+    )
+
+    def __init__(self, latency: float = 0.0, response: Optional[str] = None,
+                 fail: bool = False):
+        self.latency = latency
+        self.response = response or self.DEFAULT_RESPONSE
+        self.fail = fail
+        self.calls = 0
+
+    def complete(self, messages: List[Dict], timeout: Optional[float] = None) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError('Fake LLM backend configured to fail')
+        return self.response
+
+
+def get_llm_backend(config: Dict):
+    """Backend selected by LLM_BACKEND ('openai' or 'fake'; FAKE_LLM_LATENCY in seconds)."""
+    name = os.getenv('LLM_BACKEND', 'openai').lower()
+    if name == 'fake':
+        return FakeLLMBackend(latency=float(os.getenv('FAKE_LLM_LATENCY', 0)))
+    if name != 'openai':
+        raise ValueError(f'Unknown LLM_BACKEND: {name}')
+    return OpenAIBackend(config)
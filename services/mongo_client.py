@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """Collects connection pool statistics from pymongo's CMAP events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.open_connections = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.total_wait_ms = 0.0
+            self.max_wait_ms = 0.0
+            self.pool_clears = 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'open_connections': self.open_connections,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_wait_ms': round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_ms, 3),
+                'pool_clears': self.pool_clears
+            }
+
+    def _wait_ms(self, event) -> float:
+        # Newer pymongo versions report the duration on the event itself;
+        # otherwise checkout runs on the caller's thread so a thread-local works.
+        duration = getattr(event, 'duration', None)
+        if duration is not None:
+            return duration * 1000
+        started = getattr(self._local, 'checkout_started', None)
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms(event)
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections = max(0, self.open_connections - 1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+def get_pool_settings() -> Dict:
+    """Read connection pool settings from the environment."""
+    return {
+        'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', 100)),
+        'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', 0)),
+        'maxIdleTimeMS': int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000)),
+        'waitQueueTimeoutMS': int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+        'maxConnecting': int(os.getenv('MONGO_MAX_CONNECTING', 2)),
+        'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        'connectTimeoutMS': int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+    }
+
+
+pool_metrics = PoolMetrics()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mongo_client() -> Optional[MongoClient]:
+    """Return the process-wide MongoClient, creating it on first use."""
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            mongo_uri = os.getenv('MONGO_URI')
+            if not mongo_uri:
+                print('Error: MONGO_URI environment variable is not set')
+                return None
+            # MongoClient connects lazily and reconnects on its own, so one
+            # instance serves the whole process for its lifetime.
+            _client = MongoClient(
+                mongo_uri,
+                event_listeners=[pool_metrics],
+                **get_pool_settings()
+            )
+    return _client
+
+
+def get_database(name: Optional[str] = None):
+    """Return a database handle backed by the shared client."""
+    client = get_mongo_client()
+    if client is None:
+        return None
+    return client[name or os.getenv('MONGO_DB_NAME', 'water_tracker')]
+
+
+def close_mongo_client() -> None:
+    """Close the shared client and its pool (e.g. on worker shutdown or after fork)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            pool_metrics.reset()
+
+
+def get_pool_status() -> Dict:
+    """Return pool configuration alongside live pool metrics."""
+    return {
+        'settings': get_pool_settings(),
+        'metrics': pool_metrics.snapshot()
+    }
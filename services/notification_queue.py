@@ -0,0 +1,261 @@
+import atexit
+import heapq
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from .cache import TTLCache
+
+
+class TransientSendError(Exception):
+    """Delivery failed but may succeed later (rate limit, 5xx, network)."""
+
+
+class PermanentSendError(Exception):
+    """Delivery can never succeed as is (invalid number, unsubscribed recipient)."""
+
+
+class TwilioTransport:
+    """Sends through Twilio, classifying failures as transient or permanent."""
+
+    def __init__(self, client_factory: Callable, from_number: str):
+        self._client_factory = client_factory
+        self.from_number = from_number
+
+    def send(self, to: str, body: str) -> str:
+        from twilio.base.exceptions import TwilioRestException
+        try:
+            message = self._client_factory().messages.create(body=body, from_=self.from_number, to=to)
+        except TwilioRestException as e:
+            if e.status == 429 or e.status >= 500:
+                raise TransientSendError(str(e))
+            raise PermanentSendError(str(e))
+        except Exception as e:
+            raise TransientSendError(str(e))
+        return message.sid
+
+
+class FakeSMSTransport:
+    """Records messages instead of sending them; can simulate latency and failures."""
+
+    def __init__(self, latency: float = 0.0, fail_rate: float = 0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to: str, body: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise TransientSendError('Simulated transport failure')
+        with self._lock:
+            self.sent.append({'to': to, 'body': body, 'sent_at': time.time()})
+            return f'fake-{len(self.sent)}'
+
+
+class MemoryDeadLetterStore:
+    """Keeps the most recent dead letters in memory."""
+
+    def __init__(self, maxlen: int = 1000):
+        self._letters = deque(maxlen=maxlen)
+
+    def add(self, letter: Dict) -> None:
+        self._letters.append(letter)
+
+    def list(self, limit: int = 100) -> List[Dict]:
+        return list(self._letters)[-limit:]
+
+
+class MongoDeadLetterStore:
+    """Persists dead letters to `sms_dead_letters`, falling back to memory if MongoDB is down."""
+
+    def __init__(self, db_factory: Callable):
+        self._db_factory = db_factory
+        self._fallback = MemoryDeadLetterStore()
+
+    def add(self, letter: Dict) -> None:
+        try:
+            db = self._db_factory()
+            if db is None:
+                raise ConnectionError('Database connection is not available')
+            db.sms_dead_letters.insert_one(dict(letter))
+        except Exception as e:
+            print(f'Failed to store SMS dead letter, keeping it in memory: {str(e)}')
+            self._fallback.add(letter)
+
+    def list(self, limit: int = 100) -> List[Dict]:
+        letters = self._fallback.list(limit)
+        db = self._db_factory()
+        if db is not None:
+            letters += list(db.sms_dead_letters.find({}, {'_id': 0}).sort('failed_at', -1).limit(limit))
+        return letters[:limit]
+
+
+class NotificationQueue:
+    """Outbound SMS queue drained by a pool of background workers.
+
+    Request paths only enqueue. Transient failures are retried with
+    exponential backoff and full jitter; permanent failures and messages
+    that run out of attempts go to the dead-letter store. A message with
+    the same recipient and dedup key as an earlier one is dropped until
+    that key expires: at the caller's `dedup_until` when given (e.g. the
+    end of the day for a daily key), else after `dedup_window` seconds.
+    Dedup state lives in this process's memory only.
+    """
+
+    def __init__(self, transport, dead_letters=None, workers: int = 4,
+                 max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 dedup_window: float = 300, max_queue: int = 10000):
+        self.transport = transport
+        self.dead_letters = dead_letters or MemoryDeadLetterStore()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self._recent = TTLCache(maxsize=max(max_queue * 10, 1000), ttl=dedup_window)
+        self._heap = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._busy = 0
+        self.counters = {'enqueued': 0, 'deduplicated': 0, 'dropped': 0,
+                         'sent': 0, 'retried': 0, 'dead': 0}
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'sms-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Let workers finish what is due within `timeout`, then stop them."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while (self._busy or (self._heap and self._heap[0][0] <= time.time())) \
+                    and time.time() < deadline:
+                self._cond.wait(0.05)
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.time()))
+        if self._heap:
+            print(f'SMS queue stopped with {len(self._heap)} undelivered messages')
+
+    def enqueue(self, to: str, body: str, dedup_key: Optional[str] = None,
+                dedup_until: Optional[float] = None) -> bool:
+        """Queue a message; False if it was a duplicate or the queue is full."""
+        dedup_key = dedup_key or hashlib.sha1(body.encode('utf-8')).hexdigest()
+        with self._cond:
+            if self._recent.get((to, dedup_key)) is not None:
+                self.counters['deduplicated'] += 1
+                return False
+            if len(self._heap) >= self.max_queue:
+                self.counters['dropped'] += 1
+                print(f'SMS queue full, dropping message to {to}')
+                return False
+            self._recent.set((to, dedup_key), True, expires_at=dedup_until)
+            self._push({'to': to, 'body': body, 'dedup_key': dedup_key,
+                        'attempts': 0, 'enqueued_at': time.time()}, 0)
+            self.counters['enqueued'] += 1
+        return True
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {**self.counters, 'queued': len(self._heap), 'in_progress': self._busy}
+
+    def _push(self, message: Dict, delay: float) -> None:
+        self._seq += 1
+        heapq.heappush(self._heap, (time.time() + delay, self._seq, message))
+        self._cond.notify()
+
+    def _backoff(self, attempts: int) -> float:
+        # Full jitter: uniform in [0, min(max_delay, base * 2^(attempts-1))]
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+
+    def _next(self) -> Optional[Dict]:
+        with self._cond:
+            while not self._stopping:
+                if self._heap:
+                    ready_at = self._heap[0][0]
+                    now = time.time()
+                    if ready_at <= now:
+                        self._busy += 1
+                        return heapq.heappop(self._heap)[2]
+                    self._cond.wait(ready_at - now)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _run(self) -> None:
+        while True:
+            message = self._next()
+            if message is None:
+                return
+            try:
+                self._deliver(message)
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+    def _deliver(self, message: Dict) -> None:
+        message['attempts'] += 1
+        try:
+            self.transport.send(message['to'], message['body'])
+        except TransientSendError as e:
+            if message['attempts'] < self.max_attempts:
+                with self._cond:
+                    self.counters['retried'] += 1
+                    self._push(message, self._backoff(message['attempts']))
+                return
+            self._dead(message, str(e))
+        except Exception as e:
+            self._dead(message, str(e))
+        else:
+            with self._cond:
+                self.counters['sent'] += 1
+
+    def _dead(self, message: Dict, error: str) -> None:
+        print(f"SMS to {message['to']} failed after {message['attempts']} attempts: {error}")
+        with self._cond:
+            self.counters['dead'] += 1
+        self.dead_letters.add({**message, 'error': error, 'failed_at': time.time()})
+
+
+def get_sms_transport():
+    """Transport selected by SMS_TRANSPORT (twilio or fake)."""
+    if os.getenv('SMS_TRANSPORT', 'twilio').lower() == 'fake':
+        return FakeSMSTransport()
+    from sms_service import TWILIO_PHONE_NUMBER, get_twilio_client
+    return TwilioTransport(get_twilio_client, TWILIO_PHONE_NUMBER)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_notification_queue() -> NotificationQueue:
+    """Process-wide queue, started on first use (SMS_TRANSPORT=twilio|fake)."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                from .mongo_client import get_database
+                queue = NotificationQueue(
+                    get_sms_transport(),
+                    dead_letters=MongoDeadLetterStore(get_database),
+                    workers=int(os.getenv('SMS_QUEUE_WORKERS', 4)),
+                    max_attempts=int(os.getenv('SMS_MAX_ATTEMPTS', 5)),
+                    dedup_window=float(os.getenv('SMS_DEDUP_WINDOW', 300))
+                )
+                queue.start()
+                atexit.register(queue.stop)
+                _queue = queue
+    return _queue
@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+from .cache import TTLCache
+
+
+# Profile fields the request paths read; _id is left out so entries serialize cleanly
+PROFILE_PROJECTION = {
+    '_id': 0, 'phone': 1, 'name': 1, 'gender': 1, 'weight': 1,
+    'height': 1, 'activity_level': 1, 'daily_goal': 1
+}
+
+
+class LocalProfileBackend:
+    """In-process TTL/LRU backend (one copy per worker)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, phone: str) -> Optional[Dict]:
+        return self._cache.get(phone)
+
+    def set(self, phone: str, profile: Dict) -> None:
+        self._cache.set(phone, profile)
+
+    def delete(self, phone: str) -> None:
+        self._cache.delete(phone)
+
+
+class RedisProfileBackend:
+    """Shared backend for any Redis-compatible server, so all workers see one copy."""
+
+    def __init__(self, url: str, ttl: float, prefix: str = 'profile:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError('PROFILE_CACHE_URL requires the redis package (pip install redis)')
+        self._client = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def get(self, phone: str) -> Optional[Dict]:
+        value = self._client.get(self.prefix + phone)
+        return json.loads(value) if value is not None else None
+
+    def set(self, phone: str, profile: Dict) -> None:
+        self._client.setex(self.prefix + phone, self.ttl, json.dumps(profile))
+
+    def delete(self, phone: str) -> None:
+        self._client.delete(self.prefix + phone)
+
+
+class ProfileCache:
+    """Read-through cache of user profiles, invalidated on profile writes.
+
+    Invalidation reaches only the backend it is called on. With the
+    in-process backend and several workers, the others keep serving the
+    old profile until their TTL expires; use the Redis backend there.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> 'ProfileCache':
+        ttl = float(os.getenv('PROFILE_CACHE_TTL', 300))
+        url = os.getenv('PROFILE_CACHE_URL')
+        if url:
+            return cls(RedisProfileBackend(url, ttl))
+        return cls(LocalProfileBackend(int(os.getenv('PROFILE_CACHE_SIZE', 10000)), ttl))
+
+    def peek(self, phone: str) -> Optional[Dict]:
+        """Return the cached profile without falling back to MongoDB."""
+        try:
+            profile = self.backend.get(phone)
+        except Exception as e:
+            # A shared backend being down must not take the request with it
+            print(f'Profile cache read failed: {str(e)}')
+            profile = None
+        self._count(profile is not None)
+        return profile
+
+    def put(self, phone: str, profile: Dict) -> None:
+        try:
+            self.backend.set(phone, profile)
+        except Exception as e:
+            print(f'Profile cache write failed: {str(e)}')
+
+    def get(self, db, phone: str) -> Optional[Dict]:
+        """Return the profile, loading and caching it on a miss."""
+        profile = self.peek(phone)
+        if profile is None:
+            profile = db.users.find_one({'phone': phone}, PROFILE_PROJECTION, max_time_ms=5000)
+            if profile is not None:
+                self.put(phone, profile)
+        return profile
+
+    def get_many(self, db, phones: Iterable[str]) -> Dict[str, Dict]:
+        """Return profiles for several users, loading all misses with one query."""
+        profiles = {}
+        missing = []
+        for phone in set(phones):
+            profile = self.peek(phone)
+            if profile is None:
+                missing.append(phone)
+            else:
+                profiles[phone] = profile
+        if missing:
+            for profile in db.users.find({'phone': {'$in': missing}}, PROFILE_PROJECTION):
+                self.put(profile['phone'], profile)
+                profiles[profile['phone']] = profile
+        return profiles
+
+    def invalidate(self, phone: str) -> None:
+        """Drop a profile after it was written."""
+        try:
+            self.backend.delete(phone)
+        except Exception as e:
+            print(f'Profile cache invalidation failed: {str(e)}')
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+profile_cache = ProfileCache.from_env()
@@ -0,0 +1,124 @@
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+DEFAULT_WEIGHT_KG = 70
+DEFAULT_HEIGHT_CM = 170
+DEFAULT_ACTIVITY_LEVEL = 'moderate'
+
+# Dashboard goal: 30ml per kg of body weight, scaled by activity level
+GOAL_ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.0,
+    'light': 1.2,
+    'moderate': 1.4,
+    'active': 1.6,
+    'very_active': 1.8
+}
+
+# Analyzer breakdown: height-scaled base plus a fixed activity allowance
+BASE_ACTIVITY_MULTIPLIERS = {
+    'low': 0.8,
+    'moderate': 1.0,
+    'high': 1.2
+}
+ACTIVITY_ADJUSTMENTS_ML = {
+    'low': 0,
+    'moderate': 300,
+    'high': 700
+}
+
+# Imperial formula: 0.67 oz per pound, scaled by activity and weather
+OZ_PER_LB = 0.67
+ML_PER_OZ = 29.5735
+IMPERIAL_ACTIVITY_FACTORS = {
+    'sedentary': 1.0,
+    'light': 1.1,
+    'moderate': 1.2,
+    'active': 1.3,
+    'very_active': 1.4
+}
+
+# Weather bucket: (temperature band, humidity band), each 0-2.
+# Temperature bands split at 80/90 F, humidity bands at 60/80 %.
+WeatherBucket = Tuple[int, int]
+NEUTRAL_WEATHER: WeatherBucket = (0, 0)
+
+
+class Recommendation(NamedTuple):
+    daily_goal_ml: int
+    base_ml: int
+    activity_adjustment_ml: int
+    weather_factor: float
+
+
+def weather_bucket(temperature_f: float, humidity: float) -> WeatherBucket:
+    """Reduce raw weather to the bands the recommendation formulas distinguish."""
+    temp_band = (temperature_f > 80) + (temperature_f > 90)
+    humidity_band = (humidity > 60) + (humidity > 80)
+    return int(temp_band), int(humidity_band)
+
+
+@lru_cache(maxsize=16)
+def weather_factor(bucket: WeatherBucket) -> float:
+    """Multiplier for a weather bucket: +10% per temperature band, +5% per humidity band."""
+    temp_band, humidity_band = bucket
+    temp_factor = 1.0
+    for _ in range(temp_band):
+        temp_factor += 0.1
+    humidity_factor = 1.0
+    for _ in range(humidity_band):
+        humidity_factor += 0.05
+    return temp_factor * humidity_factor
+
+
+@lru_cache(maxsize=4096)
+def recommend(weight: float, height: float, activity_level: str,
+              bucket: WeatherBucket = NEUTRAL_WEATHER) -> Recommendation:
+    """Metric recommendation (kg, cm), memoized on its inputs."""
+    factor = weather_factor(bucket)
+    goal = weight * 30 * GOAL_ACTIVITY_MULTIPLIERS.get(activity_level, 1.0)
+    base = weight * 30 * (height / 170.0) * BASE_ACTIVITY_MULTIPLIERS.get(activity_level, 1.0)
+    return Recommendation(
+        daily_goal_ml=int(goal * factor),
+        base_ml=int(base),
+        activity_adjustment_ml=ACTIVITY_ADJUSTMENTS_ML.get(activity_level, 0),
+        weather_factor=factor
+    )
+
+
+@lru_cache(maxsize=4096)
+def recommend_imperial(weight_lbs: float, activity_level: str,
+                       bucket: WeatherBucket = NEUTRAL_WEATHER) -> Dict:
+    """Imperial recommendation (lbs, oz), memoized on its inputs."""
+    activity_factor = IMPERIAL_ACTIVITY_FACTORS.get(activity_level.lower(), 1.0)
+    factor = weather_factor(bucket)
+    total_oz = weight_lbs * OZ_PER_LB * activity_factor * factor
+    return {
+        'recommended_intake_oz': round(total_oz, 1),
+        'recommended_intake_ml': round(total_oz * ML_PER_OZ, 1),
+        'weather_factor': round(factor, 2),
+        'activity_factor': round(activity_factor, 2)
+    }
+
+
+def _number(value, default: float) -> float:
+    try:
+        return float(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def profile_inputs(profile: Dict) -> Tuple[float, float, str]:
+    """Normalize a stored profile into hashable recommendation inputs."""
+    return (
+        _number(profile.get('weight'), DEFAULT_WEIGHT_KG),
+        _number(profile.get('height'), DEFAULT_HEIGHT_CM),
+        profile.get('activity_level', DEFAULT_ACTIVITY_LEVEL)
+    )
+
+
+def daily_goal_for(profile: Dict, bucket: Optional[WeatherBucket] = None) -> int:
+    """Daily goal in ml for a profile: the stored value if present, else computed."""
+    if bucket is None and profile.get('daily_goal'):
+        return profile['daily_goal']
+    return recommend(*profile_inputs(profile), bucket or NEUTRAL_WEATHER).daily_goal_ml
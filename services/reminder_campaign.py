@@ -0,0 +1,237 @@
+"""Bulk hydration reminders.
+
+Streams users from MongoDB, drops those already at today's goal (and,
+optionally, those the forecast model expects to reach it), renders each
+message from a precompiled template and sends through a rate-limited
+pool of concurrent senders.
+
+Each recipient is claimed in `sms_sent` under the hour's dedup key before
+the send, so a second run in the same hour (overlapping cron, restart
+after a crash) skips everyone already reminded. A crash between claim
+and send means that user misses this hour's reminder rather than getting
+it twice.
+
+    python -m services.reminder_campaign --rate 30 --concurrency 16
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from .notification_queue import PermanentSendError, TransientSendError, get_sms_transport
+from .recommendation import daily_goal_for
+from .profile_cache import PROFILE_PROJECTION
+from .sms_templates import greeting_for, reminder_template
+
+
+DEFAULT_RATE = float(os.getenv('REMINDER_RATE_LIMIT', 10))
+DEFAULT_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', 8))
+USER_BATCH_SIZE = 500
+DUPLICATE_KEY_ERROR = 11000
+
+
+class RateLimiter:
+    """Thread-safe token bucket: `rate` sends per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ReminderCampaign:
+    """One reminder fan-out over every eligible user."""
+
+    def __init__(self, db, transport=None, rate: float = DEFAULT_RATE,
+                 concurrency: int = DEFAULT_CONCURRENCY, use_forecast: bool = False,
+                 retry_queue=None):
+        self.db = db
+        self.transport = transport or get_sms_transport()
+        self.limiter = RateLimiter(rate)
+        self.concurrency = concurrency
+        self.use_forecast = use_forecast
+        # Transient failures are handed to the notification queue for retry
+        self.retry_queue = retry_queue
+        self._lock = threading.Lock()
+        self._latencies = []
+        self.counts = {'scanned': 0, 'at_goal': 0, 'forecast_on_track': 0, 'already_sent': 0,
+                       'sent': 0, 'failed': 0, 'retry_queued': 0}
+
+    def iter_batches(self) -> Iterator[List[Dict]]:
+        """Stream users in phone order, USER_BATCH_SIZE at a time."""
+        cursor = self.db.users.find(
+            {'phone': {'$type': 'string'}}, PROFILE_PROJECTION
+        ).sort('phone', ASCENDING).batch_size(USER_BATCH_SIZE)
+        batch = []
+        for user in cursor:
+            batch.append(user)
+            if len(batch) == USER_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def eligible(self, users: List[Dict], today: str, now: float) -> List[Dict]:
+        """Users in the batch who have not reached today's goal yet."""
+        totals = {
+            doc['phone']: doc.get('total_intake', 0)
+            for doc in self.db.water_intake.find(
+                {'phone': {'$in': [user['phone'] for user in users]}, 'date': today},
+                {'_id': 0, 'phone': 1, 'total_intake': 1}
+            )
+        }
+        below = [user for user in users
+                 if totals.get(user['phone'], 0) < daily_goal_for(user)]
+        self._count('at_goal', len(users) - len(below))
+        if self.use_forecast and below:
+            from intake_forecast import users_likely_to_miss
+            missing = set(users_likely_to_miss(self.db, [user['phone'] for user in below], now))
+            on_track = [user for user in below if user['phone'] not in missing]
+            self._count('forecast_on_track', len(on_track))
+            below = [user for user in below if user['phone'] in missing]
+        return below
+
+    def claim(self, phones: List[str], dedup_key: str, expires_at: float) -> List[str]:
+        """Record sent markers for the phones; return those not already claimed for the key."""
+        if not phones:
+            return []
+        expires = datetime.fromtimestamp(expires_at, timezone.utc)
+        taken = set()
+        try:
+            self.db.sms_sent.insert_many(
+                [{'phone': phone, 'dedup_key': dedup_key, 'expires_at': expires, 'claimed_at': time.time()}
+                 for phone in phones],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') != DUPLICATE_KEY_ERROR:
+                    raise
+                taken.add(phones[error['index']])
+        self._count('already_sent', len(taken))
+        return [phone for phone in phones if phone not in taken]
+
+    def release(self, phone: str, dedup_key: str) -> None:
+        """Drop a marker after a send that definitely failed, so a re-run may retry it."""
+        try:
+            self.db.sms_sent.delete_one({'phone': phone, 'dedup_key': dedup_key})
+        except Exception as e:
+            print(f'Failed to release reminder marker for {phone}: {str(e)}')
+
+    def run(self, now: Optional[float] = None) -> Dict:
+        now = now if now is not None else time.time()
+        local = time.localtime(now)
+        today = time.strftime('%Y-%m-%d', local)
+        dedup_key = f"reminder:{time.strftime('%Y-%m-%d %H', local)}"
+        # Markers (and the retry queue's dedup) last until the top of the next hour
+        dedup_until = now - local.tm_min * 60 - local.tm_sec + 3600
+        # Everything but the name is the same for the whole campaign
+        template = reminder_template.partial(greeting=greeting_for(local.tm_hour))
+
+        started = time.perf_counter()
+        # At most 2x concurrency sends outstanding, so the cursor is not drained into memory
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='reminder') as pool:
+            for users in self.iter_batches():
+                self._count('scanned', len(users))
+                eligible = self.eligible(users, today, now)
+                claimed = set(self.claim([user['phone'] for user in eligible], dedup_key, dedup_until))
+                for user in eligible:
+                    if user['phone'] not in claimed:
+                        continue
+                    body = template.render({'name': user.get('name') or 'there'})
+                    slots.acquire()
+                    future = pool.submit(self._send, user['phone'], body, dedup_key, dedup_until)
+                    future.add_done_callback(lambda _: slots.release())
+        return self.report(time.perf_counter() - started)
+
+    def report(self, seconds: float) -> Dict:
+        latencies = np.array(self._latencies) * 1000
+        percentiles = (np.percentile(latencies, [50, 90, 99]).round(1).tolist()
+                       if len(latencies) else [0.0, 0.0, 0.0])
+        return {
+            **self.counts,
+            'seconds': round(seconds, 3),
+            'throughput_per_sec': round(self.counts['sent'] / seconds, 2) if seconds else 0.0,
+            'latency_ms': {
+                'p50': percentiles[0],
+                'p90': percentiles[1],
+                'p99': percentiles[2],
+                'max': round(float(latencies.max()), 1) if len(latencies) else 0.0
+            }
+        }
+
+    def _send(self, phone: str, body: str, dedup_key: str, dedup_until: float) -> None:
+        self.limiter.acquire()
+        started = time.perf_counter()
+        try:
+            self.transport.send(phone, body)
+        except TransientSendError as e:
+            if self.retry_queue is not None and self.retry_queue.enqueue(phone, body, dedup_key, dedup_until):
+                self._count('retry_queued')
+            else:
+                print(f'Reminder to {phone} failed: {str(e)}')
+                self.release(phone, dedup_key)
+                self._count('failed')
+            return
+        except (PermanentSendError, Exception) as e:
+            print(f'Reminder to {phone} failed: {str(e)}')
+            self.release(phone, dedup_key)
+            self._count('failed')
+            return
+        latency = time.perf_counter() - started
+        with self._lock:
+            self._latencies.append(latency)
+            self.counts['sent'] += 1
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[counter] += amount
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from .db_indexes import INDEX_SPECS, IndexManager
+    from .mongo_client import get_database
+    from .notification_queue import get_notification_queue
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Send hydration reminders to users below their goal')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='max messages per second')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--forecast', action='store_true',
+                        help='only remind users the forecast model expects to miss their goal')
+    args = parser.parse_args()
+
+    db = get_database()
+    if db is None:
+        raise SystemExit('Database connection is not available')
+    IndexManager(db, {'sms_sent': INDEX_SPECS['sms_sent']}).ensure_indexes()
+    campaign = ReminderCampaign(db, rate=args.rate, concurrency=args.concurrency,
+                                use_forecast=args.forecast, retry_queue=get_notification_queue())
+    print(f'Reminder campaign finished: {campaign.run()}')
+
+
+if __name__ == '__main__':
+    main()
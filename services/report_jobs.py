@@ -0,0 +1,126 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from .cache import TTLCache
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds `max_pending` unfinished jobs."""
+
+
+class ReportJob:
+    """One report generation job and its outcome."""
+
+    def __init__(self, dedup_key: Hashable):
+        self.id = uuid.uuid4().hex
+        self.dedup_key = dedup_key
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict:
+        job = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if self.status == 'succeeded':
+            job['result'] = self.result
+        elif self.status == 'failed':
+            job['error'] = self.error
+        return job
+
+
+class ReportJobQueue:
+    """Runs slow report generation on a bounded thread pool, off the request path.
+
+    A request submits a job and gets its id back at once; the result is
+    polled (optionally long-polled) by id. A user with a job still queued
+    or running for the same inputs gets that job back instead of a new one. Jobs live in this
+    process only, and finished jobs are kept for `result_ttl` seconds.
+    """
+
+    def __init__(self, run: Callable[..., Dict], max_workers: int = 4,
+                 max_pending: int = 100, result_ttl: float = 600,
+                 max_results: int = 10000):
+        self._run = run
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report-job')
+        self._jobs = TTLCache(maxsize=max_results, ttl=result_ttl)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+
+    def submit(self, dedup_key: Hashable, *args, **kwargs) -> Tuple[ReportJob, bool]:
+        """Queue a job; returns (job, created). Raises QueueFullError.
+
+        `dedup_key` must identify everything the result depends on (the
+        user and the inputs), since a submit whose key matches a job still
+        in flight gets that job back.
+        """
+        with self._lock:
+            job = self._in_flight.get(dedup_key)
+            if job is not None:
+                self.deduplicated += 1
+                return job, False
+            if len(self._in_flight) >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError('Too many report jobs in progress, try again shortly')
+            job = ReportJob(dedup_key)
+            self._in_flight[dedup_key] = job
+            # Unfinished jobs never expire; the TTL starts once they finish
+            self._jobs.set(job.id, job, expires_at=float('inf'))
+            self.submitted += 1
+        self._executor.submit(self._execute, job, args, kwargs)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'in_flight': len(self._in_flight),
+                'max_pending': self.max_pending,
+                'submitted': self.submitted,
+                'deduplicated': self.deduplicated,
+                'rejected': self.rejected
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _execute(self, job: ReportJob, args, kwargs) -> None:
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = self._run(*args, **kwargs)
+            job.status = 'succeeded'
+        except Exception as e:
+            print(f'Report job {job.id} failed: {str(e)}')
+            job.error = str(e)
+            job.status = 'failed'
+        job.finished_at = time.time()
+        with self._lock:
+            if self._in_flight.get(job.dedup_key) is job:
+                del self._in_flight[job.dedup_key]
+            self._jobs.set(job.id, job)
+        job._done.set()
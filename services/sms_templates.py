@@ -0,0 +1,51 @@
+from string import Formatter
+from typing import Dict, List, Tuple
+
+
+GREETINGS = ["Good morning", "Good afternoon", "Good evening"]
+
+REMINDER_TEMPLATE = ("{greeting} {name}! 👋\nTime to take care of yourself! Remember to drink water "
+                     "and stay hydrated. 💧\nYour health matters! - Water_Tracker")
+GOAL_TEMPLATE = ("Hello {name}! 👋 Congratulations! You've reached your daily water intake goal of "
+                 "{goal_amount}ml! 💧 Keep up the great work! - Water Tracker")
+
+
+def greeting_for(hour: int) -> str:
+    return GREETINGS[0] if hour < 12 else GREETINGS[1] if hour < 17 else GREETINGS[2]
+
+
+class CompiledTemplate:
+    """A message template parsed once into literal text and field slots.
+
+    `partial` binds fields that are the same for a whole campaign (such as
+    the greeting), so rendering per recipient is a single join.
+    """
+
+    def __init__(self, parts: List[Tuple[str, str]]):
+        self._parts = parts
+        self.fields = [field for _, field in parts if field]
+
+    @classmethod
+    def compile(cls, template: str) -> 'CompiledTemplate':
+        return cls([(literal, field or '') for literal, field, _, _ in Formatter().parse(template)])
+
+    def partial(self, **values) -> 'CompiledTemplate':
+        parts = []
+        pending = ''
+        for literal, field in self._parts:
+            pending += literal
+            if field in values:
+                pending += str(values[field])
+            else:
+                parts.append((pending, field))
+                pending = ''
+        if pending:
+            parts.append((pending, ''))
+        return CompiledTemplate(parts)
+
+    def render(self, values: Dict) -> str:
+        return ''.join([literal + (str(values[field]) if field else '') for literal, field in self._parts])
+
+
+reminder_template = CompiledTemplate.compile(REMINDER_TEMPLATE)
+goal_template = CompiledTemplate.compile(GOAL_TEMPLATE)
@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.ai_config import AIConfig
+from .cache import TTLCache
+
+
+class WeatherReading(NamedTuple):
+    temperature: float
+    humidity: float
+    condition: str
+    fetched_at: float
+
+
+class OpenWeatherMapProvider:
+    """Current weather from OpenWeatherMap over a pooled, keep-alive HTTP session."""
+
+    BASE_URL = 'http://api.openweathermap.org/data/2.5/weather'
+
+    def __init__(self, api_key: str, units: str = 'imperial',
+                 timeout: Tuple[float, float] = (3.05, 5), pool_size: int = 20,
+                 base_url: str = BASE_URL):
+        self.api_key = api_key
+        self.units = units
+        self.timeout = timeout
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, city: str) -> WeatherReading:
+        response = self.session.get(
+            self.base_url,
+            params={'q': city, 'appid': self.api_key, 'units': self.units},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        return WeatherReading(
+            temperature=data['main']['temp'],
+            humidity=data['main']['humidity'],
+            condition=(data.get('weather') or [{}])[0].get('main', 'unknown').lower(),
+            fetched_at=time.time()
+        )
+
+
+class FakeWeatherProvider:
+    """Fixed readings per city with optional latency, for tests and local runs."""
+
+    def __init__(self, readings: Optional[Dict[str, Tuple[float, float]]] = None,
+                 default: Tuple[float, float] = (70, 50), latency: float = 0.0):
+        self.readings = {city.lower(): value for city, value in (readings or {}).items()}
+        self.default = default
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, city: str) -> WeatherReading:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        temperature, humidity = self.readings.get(city.lower(), self.default)
+        return WeatherReading(temperature, humidity, 'clear', time.time())
+
+
+class CachedWeatherProvider:
+    """Per-city weather cache in front of a provider.
+
+    Readings younger than `ttl` are served as is. Readings up to
+    `ttl + stale_ttl` old are served immediately while one background
+    refresh runs (stale-while-revalidate). Concurrent misses for the same
+    city share a single fetch, and a failed fetch is remembered for
+    `error_ttl` seconds so an unknown city or an outage is not hammered:
+    a miss returns None and a stale reading is served without another
+    refresh until that time has passed.
+    """
+
+    def __init__(self, provider, ttl: float = 3600, stale_ttl: Optional[float] = None,
+                 error_ttl: float = 60, max_cities: int = 10000, refresh_workers: int = 2):
+        self.provider = provider
+        self.ttl = ttl
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        self.error_ttl = error_ttl
+        self._readings = TTLCache(maxsize=max_cities, ttl=self.ttl + self.stale_ttl)
+        self._errors = TTLCache(maxsize=max_cities, ttl=error_ttl)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers,
+                                             thread_name_prefix='weather-refresh')
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    def get(self, city: str) -> Optional[WeatherReading]:
+        """Reading for the city, or None if it cannot be fetched."""
+        key = city.strip().lower()
+        if not key:
+            return None
+        reading = self._readings.get(key)
+        if reading is not None:
+            if time.time() - reading.fetched_at < self.ttl:
+                self._count('fresh_hits')
+            else:
+                self._count('stale_hits')
+                if self._errors.get(key) is None:
+                    self._fetch(key, background=True)
+            return reading
+        if self._errors.get(key) is not None:
+            return None
+        self._count('misses')
+        try:
+            return self._fetch(key).result()
+        except Exception:
+            return None
+
+    def prefetch(self, city: str) -> Future:
+        """Start (or join) a fetch for the city; runs on the calling thread."""
+        return self._fetch(city.strip().lower())
+
+    def prefetch_cities(self, cities: Iterable[str], concurrency: int = 8) -> Dict:
+        """Fetch every distinct city without a fresh reading, `concurrency` at a time.
+
+        Blocks until all fetches finish, so lookups for these cities that
+        follow (e.g. per-user recommendations in a batch) do no network I/O.
+        """
+        now = time.time()
+        due = []
+        for key in {city.strip().lower() for city in cities if city and city.strip()}:
+            reading = self._readings.get(key)
+            if reading is not None and now - reading.fetched_at < self.ttl:
+                continue
+            if self._errors.get(key) is None:
+                due.append(key)
+        failed = 0
+        if due:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(due)),
+                                    thread_name_prefix='weather-prefetch') as pool:
+                futures = list(pool.map(self.prefetch, due))
+            for future in futures:
+                # A joined background refresh may still be running
+                try:
+                    future.result()
+                except Exception:
+                    failed += 1
+        return {'fetched': len(due) - failed, 'failed': failed}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.fresh_hits + self.stale_hits + self.misses
+            return {
+                'cities': len(self._readings),
+                'fresh_hits': self.fresh_hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'fetches': self.fetches,
+                'fetch_errors': self.fetch_errors,
+                'hit_rate': round((self.fresh_hits + self.stale_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def _fetch(self, key: str, background: bool = False) -> Future:
+        # Single flight: one fetch per city at a time, everyone else joins it
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = Future()
+            self._in_flight[key] = future
+            self.fetches += 1
+        if background:
+            self._refresher.submit(self._run_fetch, key, future)
+        else:
+            self._run_fetch(key, future)
+        return future
+
+    def _run_fetch(self, key: str, future: Future) -> None:
+        try:
+            reading = self.provider.fetch(key)
+        except Exception as e:
+            print(f'Error fetching weather data for {key}: {str(e)}')
+            self._count('fetch_errors')
+            # Older readings keep being served; this only holds off refetches
+            self._errors.set(key, True)
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            return
+        self._readings.set(key, reading)
+        self._errors.delete(key)
+        with self._lock:
+            self._in_flight.pop(key, None)
+        future.set_result(reading)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+_weather_provider = None
+_weather_provider_lock = threading.Lock()
+
+
+def get_weather_provider() -> CachedWeatherProvider:
+    """Process-wide cached provider; refreshes every AIConfig update_frequency hours.
+
+    WEATHER_PROVIDER=fake swaps in FakeWeatherProvider; WEATHER_API_KEY
+    overrides the key from AIConfig.
+    """
+    global _weather_provider
+    if _weather_provider is None:
+        with _weather_provider_lock:
+            if _weather_provider is None:
+                config = AIConfig().get_weather_config()
+                if os.getenv('WEATHER_PROVIDER', 'openweathermap').lower() == 'fake':
+                    provider = FakeWeatherProvider()
+                else:
+                    provider = OpenWeatherMapProvider(
+                        os.getenv('WEATHER_API_KEY') or config['api_key'],
+                        units=config.get('units', 'imperial')
+                    )
+                _weather_provider = CachedWeatherProvider(
+                    provider, ttl=float(config['update_frequency']) * 3600
+                )
+    return _weather_provider
@@ -0,0 +1,185 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IntakeWriteBuffer:
+    """Optional write-behind buffer for single intake writes.
+
+    Entries are journaled to a local spill file (fsynced) before they are
+    acknowledged, kept in memory per (phone, date), and flushed through
+    IntakeWriter.record_batch once `max_events` accumulate or
+    `flush_interval` seconds pass. Every entry carries an idempotency key,
+    so replaying a journal that was partially flushed before a crash
+    cannot double count.
+
+    The buffer lives in one process: pending_totals only sees entries
+    taken by this worker. Read-your-writes on /api/water/data therefore
+    holds only with a single worker or with requests routed to the same
+    worker per user (sticky sessions).
+    """
+
+    def __init__(self, writer_factory: Callable[[], Optional[object]],
+                 spill_dir: str,
+                 max_events: int = 200,
+                 flush_interval: float = 2.0):
+        self._writer_factory = writer_factory
+        self.spill_dir = spill_dir
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+
+        self._pending = []
+        self._pending_totals = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        os.makedirs(spill_dir, exist_ok=True)
+        # The nonce keeps a restarted process that reuses a PID (PID 1 in a
+        # container) from appending to, and later deleting, a dead one's journal
+        self._journal_path = os.path.join(spill_dir, f'intake-{os.getpid()}-{uuid.uuid4().hex[:12]}.jsonl')
+        self._journal = open(self._journal_path, 'a', encoding='utf-8')
+
+    def start(self) -> None:
+        """Replay journals left behind by dead processes, then flush in the background."""
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name='intake-write-behind', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and flush what is left."""
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+    def add(self, phone: str, amount: float, timestamp: Optional[float] = None) -> None:
+        """Durably buffer one entry."""
+        event = {
+            'phone': phone,
+            'amount': amount,
+            'timestamp': timestamp if timestamp is not None else time.time(),
+            'key': f'wb-{uuid.uuid4().hex}'
+        }
+        with self._lock:
+            self._append_journal([event])
+            self._track(event)
+            full = len(self._pending) >= self.max_events
+        if full:
+            self._wake.set()
+
+    def pending_totals(self, phone: str, dates: Iterable[str]) -> Dict[str, float]:
+        """Amounts buffered but not yet flushed, so reads can include them."""
+        with self._lock:
+            return {date: self._pending_totals.get((phone, date), 0) for date in dates}
+
+    def flush(self) -> Dict:
+        """Write all buffered entries with one batch; keep them if the write fails."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return {'accepted': 0, 'duplicates': 0}
+                events = self._pending
+                self._pending = []
+                # Rotate the journal: the flushing file is removed only once
+                # its entries are safely in MongoDB.
+                flushing_path = self._rotate_journal()
+
+            try:
+                writer = self._writer_factory()
+                if writer is None:
+                    raise ConnectionError('Database connection is not available')
+                result = writer.record_batch(events)
+            except Exception as e:
+                print(f'Write-behind flush failed, keeping {len(events)} entries: {str(e)}')
+                with self._lock:
+                    self._pending = events + self._pending
+                    self._append_journal(events)
+                os.remove(flushing_path)
+                return {'accepted': 0, 'duplicates': 0}
+
+            with self._lock:
+                for event in events:
+                    key = (event['phone'], self._date(event))
+                    self._pending_totals[key] -= event['amount']
+                    if self._pending_totals[key] <= 1e-9:
+                        del self._pending_totals[key]
+            os.remove(flushing_path)
+            return result
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            self.flush()
+
+    def _track(self, event: Dict) -> None:
+        self._pending.append(event)
+        key = (event['phone'], self._date(event))
+        self._pending_totals[key] = self._pending_totals.get(key, 0) + event['amount']
+
+    def _date(self, event: Dict) -> str:
+        return time.strftime('%Y-%m-%d', time.localtime(event['timestamp']))
+
+    def _append_journal(self, events: List[Dict]) -> None:
+        for event in events:
+            self._journal.write(json.dumps(event) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _rotate_journal(self) -> str:
+        self._journal.close()
+        flushing_path = f'{self._journal_path}.{uuid.uuid4().hex}.flushing'
+        os.rename(self._journal_path, flushing_path)
+        self._journal = open(self._journal_path, 'a', encoding='utf-8')
+        return flushing_path
+
+    def _recover(self) -> None:
+        recovered = 0
+        for path in glob.glob(os.path.join(self.spill_dir, 'intake-*.jsonl*')):
+            if path.startswith(self._journal_path):
+                continue
+            pid = int(os.path.basename(path).split('-')[1].split('.')[0])
+            # A journal carrying our own PID but not our nonce was left by an earlier process
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            # Claim the orphaned journal by renaming it; another worker may race us
+            claimed = f'{self._journal_path}.{uuid.uuid4().hex}.recovered'
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            events = []
+            with open(claimed, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # Torn final line from a crash mid-write; it was never acknowledged
+                        continue
+            with self._lock:
+                self._append_journal(events)
+                for event in events:
+                    self._track(event)
+            os.remove(claimed)
+            recovered += len(events)
+        if recovered:
+            print(f'Recovered {recovered} buffered intake entries from spill files')
+            self._wake.set()
@@ -1,52 +1,91 @@
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException
 from functools import wraps
 import os
+import threading
 from dotenv import load_dotenv
-import time
+from datetime import datetime, timedelta
+from services.sms_templates import goal_template, greeting_for, reminder_template
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Twilio client
-twilio_client = Client(
-    os.getenv('TWILIO_ACCOUNT_SID'),
-    os.getenv('TWILIO_AUTH_TOKEN')
-)
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
+TWILIO_HTTP_POOL_SIZE = int(os.getenv('TWILIO_HTTP_POOL_SIZE', 16))
+TWILIO_TIMEOUT = float(os.getenv('TWILIO_TIMEOUT', 10))
 
-def send_sms(to_number, message, max_retries=3, retry_delay=2):
-    """Send SMS using Twilio with retry mechanism."""
-    for attempt in range(max_retries):
-        try:
-            message = twilio_client.messages.create(
-                body=message,
-                from_=TWILIO_PHONE_NUMBER,
-                to=to_number
-            )
-            return {'success': True, 'message_sid': message.sid}
-        except TwilioRestException as e:
-            if attempt == max_retries - 1:
-                return {'success': False, 'error': str(e)}
-            time.sleep(retry_delay)
-        except Exception as e:
-            return {'success': False, 'error': f"Unexpected error: {str(e)}"}
+# Twilio client, created on first send
+_twilio_client = None
+_twilio_client_lock = threading.Lock()
+
+def _build_twilio_client():
+    """Twilio client on one pooled HTTP session, sized for concurrent senders."""
+    from requests.adapters import HTTPAdapter
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+
+    http_client = TwilioHttpClient(pool_connections=True, timeout=TWILIO_TIMEOUT)
+    http_client.session.mount('https://', HTTPAdapter(pool_connections=1,
+                                                      pool_maxsize=TWILIO_HTTP_POOL_SIZE))
+    return Client(
+        os.getenv('TWILIO_ACCOUNT_SID'),
+        os.getenv('TWILIO_AUTH_TOKEN'),
+        http_client=http_client
+    )
+
+def get_twilio_client():
+    """Process-wide Twilio client; the SDK is imported and the client built on first use."""
+    global _twilio_client
+    if _twilio_client is None:
+        with _twilio_client_lock:
+            if _twilio_client is None:
+                _twilio_client = _build_twilio_client()
+    return _twilio_client
+
+def send_sms_now(to_number, message):
+    """Send one SMS synchronously, without retries (blocks on Twilio)."""
+    from twilio.base.exceptions import TwilioRestException
+    try:
+        message = get_twilio_client().messages.create(
+            body=message,
+            from_=TWILIO_PHONE_NUMBER,
+            to=to_number
+        )
+        return {'success': True, 'message_sid': message.sid}
+    except TwilioRestException as e:
+        return {'success': False, 'error': str(e)}
+    except Exception as e:
+        return {'success': False, 'error': f"Unexpected error: {str(e)}"}
+
+def send_sms(to_number, message, dedup_key=None, dedup_until=None):
+    """Queue an SMS for background delivery with retries; never blocks on Twilio.
+
+    A message with the same dedup key is suppressed until `dedup_until`
+    (epoch seconds), or for SMS_DEDUP_WINDOW seconds when not given.
+    """
+    from services.notification_queue import get_notification_queue
+    queued = get_notification_queue().enqueue(to_number, message, dedup_key, dedup_until)
+    if not queued:
+        return {'success': False, 'queued': False, 'error': 'Duplicate message or queue full'}
+    return {'success': True, 'queued': True}
 
 def test_sms_service(phone_number):
     """Test SMS service by sending a test message."""
     test_message = "This is a test message from your Water Tracker app! 💧"
-    return send_sms(phone_number, test_message)
+    return send_sms_now(phone_number, test_message)
 
 def send_goal_achievement_notification(phone_number, goal_amount, name):
     """Send notification when user reaches their daily water intake goal."""
-    message = f"Hello {name}! 👋 Congratulations! You've reached your daily water intake goal of {goal_amount}ml! 💧 Keep up the great work! - Water Tracker"
-    return send_sms(phone_number, message)
+    message = goal_template.render({'name': name, 'goal_amount': goal_amount})
+    now = datetime.now()
+    # Once per day: the key is suppressed until midnight
+    end_of_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return send_sms(phone_number, message, dedup_key=f"goal:{now.date()}",
+                    dedup_until=end_of_day.timestamp())
 
 def send_reminder_notification(phone_number, name):
     """Send reminder notification to drink water."""
-    greetings = ["Good morning", "Good afternoon", "Good evening"]
-    from datetime import datetime
-    hour = datetime.now().hour
-    greeting = greetings[0] if hour < 12 else greetings[1] if hour < 17 else greetings[2]
-    message = f"{greeting} {name}! 👋\nTime to take care of yourself! Remember to drink water and stay hydrated. 💧\nYour health matters! - Water_Tracker"
-    return send_sms(phone_number, message)
\ No newline at end of file
+    message = reminder_template.render({'greeting': greeting_for(datetime.now().hour), 'name': name})
+    now = datetime.now()
+    # Once per hour: the key is suppressed until the top of the next hour
+    end_of_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return send_sms(phone_number, message, dedup_key=f"reminder:{now.strftime('%Y-%m-%d %H')}",
+                    dedup_until=end_of_hour.timestamp())
\ No newline at end of file
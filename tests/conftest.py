@@ -0,0 +1,12 @@
+import mongomock
+import pytest
+
+from services.db_indexes import IndexManager
+
+
+@pytest.fixture
+def db():
+    """In-memory database with the production indexes (unique keys included)."""
+    db = mongomock.MongoClient().db
+    IndexManager(db).ensure_indexes()
+    return db
@@ -0,0 +1,22 @@
+import numpy as np
+
+from batch_analytics import IntakeTable
+from intake_forecast import build_training_set
+
+
+def _tables(users=5, entries=200):
+    rng = np.random.default_rng(0)
+    for user in range(users):
+        yield IntakeTable(np.array([f'+1555000{user}'] * entries),
+                          86400 * 19000 + rng.integers(0, 86400 * 10, entries),
+                          rng.random(entries) * 300)
+
+
+def test_max_samples_keeps_a_bounded_subset_while_streaming():
+    features, targets = build_training_set(_tables(), {})
+    full = {tuple(row) + (target,) for row, target in zip(features, targets)}
+    assert len(targets) > 100
+
+    features, targets = build_training_set(_tables(), {}, max_samples=100)
+    assert features.shape == (100, features.shape[1])
+    assert all(tuple(row) + (target,) in full for row, target in zip(features, targets))
@@ -0,0 +1,82 @@
+import time
+from datetime import date
+
+import pytest
+
+from services.intake_rollups import IntakeRollups
+from services.intake_writer import IntakeWriter
+
+PHONE = '+15550002'
+
+
+@pytest.fixture(autouse=True)
+def user(db):
+    db.users.insert_one({'phone': PHONE, 'daily_goal': 250})
+
+
+def _event(amount, key, timestamp):
+    return {'phone': PHONE, 'amount': amount, 'timestamp': timestamp, 'key': key}
+
+
+def _lifetime(db):
+    return db.water_rollups.find_one({'phone': PHONE, 'period': 'all'}, {'_id': 0})
+
+
+def test_interleaved_batches_count_the_day_and_goal_hit_once(db):
+    now = time.time()
+    # Give the user rollups already, so today's writes are incremental
+    IntakeWriter(db).record_batch([_event(300, 'earlier', now - 2 * 86400)])
+
+    deferred = []
+    writers = [IntakeWriter(db), IntakeWriter(db)]
+    for writer in writers:
+        writer._update_rollups = lambda *args, writer=writer: deferred.append((writer, args))
+    writers[0].record_batch([_event(100, 'a', now)])
+    writers[1].record_batch([_event(200, 'b', now)])
+    # Both counter writes happen before either rollup update
+    for writer, args in deferred:
+        IntakeWriter._update_rollups(writer, *args)
+
+    lifetime = _lifetime(db)
+    assert lifetime['total'] == 600
+    assert lifetime['days_logged'] == 2
+    assert lifetime['goal_hits'] == 2
+
+
+def test_replayed_batch_is_reported_as_duplicates(db):
+    now = time.time()
+    batch = [_event(100, 'a', now), _event(150, 'b', now)]
+    writer = IntakeWriter(db)
+    assert writer.record_batch(batch) == {'accepted': 2, 'duplicates': 0}
+    assert writer.record_batch(batch) == {'accepted': 0, 'duplicates': 2}
+
+    day = db.water_intake.find_one({'phone': PHONE, 'date': time.strftime('%Y-%m-%d')})
+    assert day['total_intake'] == 250
+    assert day['record_count'] == 2
+    summary = IntakeRollups(db).get_summary(PHONE, date.today())
+    assert summary['all']['total'] == 250
+    assert summary['all']['goal_hits'] == 1
+
+
+def test_key_applied_concurrently_collides_and_counts_as_duplicate(db):
+    now = time.time()
+    event = _event(120, 'raced', now)
+    writer, other = IntakeWriter(db), IntakeWriter(db)
+    drop_applied = writer._drop_applied
+
+    def racing_drop_applied(groups, duplicates):
+        fresh = drop_applied(groups, duplicates)
+        if not other_done:
+            # Another writer applies the same key after the check
+            other_done.append(other.record_batch([dict(event)]))
+        return fresh
+
+    other_done = []
+    writer._drop_applied = racing_drop_applied
+    assert writer.record_batch([event]) == {'accepted': 0, 'duplicates': 1}
+    assert other_done == [{'accepted': 1, 'duplicates': 0}]
+
+    day = db.water_intake.find_one({'phone': PHONE, 'date': time.strftime('%Y-%m-%d')})
+    assert day['total_intake'] == 120
+    assert day['record_count'] == 1
+    assert db.water_intake.count_documents({'phone': PHONE}) == 1
@@ -0,0 +1,20 @@
+import time
+
+from services.weather_provider import CachedWeatherProvider, FakeWeatherProvider
+
+
+def test_prefetch_cities_fetches_each_city_once_and_concurrently():
+    fake = FakeWeatherProvider({'Austin': (98, 40)}, latency=0.1)
+    weather = CachedWeatherProvider(fake)
+
+    started = time.perf_counter()
+    result = weather.prefetch_cities(['Austin', ' austin', 'Boston', 'Denver', 'Miami', ''],
+                                     concurrency=4)
+    assert time.perf_counter() - started < 0.3
+    assert result == {'fetched': 4, 'failed': 0}
+    assert fake.calls == 4
+
+    assert weather.get('Austin').temperature == 98
+    assert weather.prefetch_cities(['Boston', 'Denver']) == {'fetched': 0, 'failed': 0}
+    assert fake.calls == 4
+    assert weather.stats()['misses'] == 0
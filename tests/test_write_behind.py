@@ -0,0 +1,113 @@
+import json
+import os
+import time
+
+import pytest
+
+from services.intake_writer import IntakeWriter
+from services.write_behind import IntakeWriteBuffer
+
+
+class FailOnce:
+    """Wraps a collection so its first bulk_write raises."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.failed = False
+
+    def bulk_write(self, *args, **kwargs):
+        if not self.failed:
+            self.failed = True
+            raise ConnectionError('simulated bucket write failure')
+        return self._collection.bulk_write(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+@pytest.fixture(autouse=True)
+def user(db):
+    db.users.insert_one({'phone': '+15550001', 'daily_goal': 2000})
+
+
+def _today():
+    return time.strftime('%Y-%m-%d')
+
+
+def _bucketed(db, phone):
+    return sorted(record['a'] for bucket in db.water_intake_buckets.find({'phone': phone})
+                  for record in bucket['records'])
+
+
+def test_failed_flush_is_not_lost_when_merged_with_new_entries(db, tmp_path):
+    writer = IntakeWriter(db)
+    writer.buckets.collection = FailOnce(writer.buckets.collection)
+    buffer = IntakeWriteBuffer(lambda: writer, spill_dir=str(tmp_path))
+
+    buffer.add('+15550001', 100)
+    assert buffer.flush() == {'accepted': 0, 'duplicates': 0}
+    buffer.add('+15550001', 250)
+    assert buffer.flush() == {'accepted': 1, 'duplicates': 1}
+
+    day = db.water_intake.find_one({'phone': '+15550001', 'date': _today()})
+    assert day['total_intake'] == 350
+    assert day['record_count'] == 2
+    assert _bucketed(db, '+15550001') == [100, 250]
+    assert buffer.pending_totals('+15550001', [_today()]) == {_today(): 0}
+
+
+def test_record_batch_applies_new_keys_alongside_replayed_ones(db):
+    writer = IntakeWriter(db)
+    now = time.time()
+    first = {'phone': '+15550001', 'amount': 300, 'timestamp': now, 'key': 'a'}
+    assert writer.record_batch([first]) == {'accepted': 1, 'duplicates': 0}
+
+    second = {'phone': '+15550001', 'amount': 200, 'timestamp': now, 'key': 'b'}
+    assert writer.record_batch([first, second]) == {'accepted': 1, 'duplicates': 1}
+
+    day = db.water_intake.find_one({'phone': '+15550001', 'date': _today()})
+    assert day['total_intake'] == 500
+    assert _bucketed(db, '+15550001') == [200, 300]
+
+
+@pytest.mark.parametrize('name', ['intake-{pid}.jsonl', 'intake-{pid}-0123456789ab.jsonl'])
+def test_recovers_journal_left_by_a_process_with_the_same_pid(db, tmp_path, name):
+    stale = tmp_path / name.format(pid=os.getpid())
+    stale.write_text(json.dumps({'phone': '+15550001', 'amount': 300,
+                                 'timestamp': time.time(), 'key': 'wb-stale'}) + '\n')
+
+    buffer = IntakeWriteBuffer(lambda: IntakeWriter(db), spill_dir=str(tmp_path))
+    buffer.start()
+    buffer.add('+15550001', 50)
+    buffer.stop()
+
+    day = db.water_intake.find_one({'phone': '+15550001', 'date': _today()})
+    assert day['total_intake'] == 350
+    assert not stale.exists()
+
+
+def test_replayed_journal_entry_collides_with_its_applied_day(db, tmp_path):
+    writer = IntakeWriter(db)
+    event = {'phone': '+15550001', 'amount': 300, 'timestamp': time.time(), 'key': 'wb-replayed'}
+    assert writer.record_batch([dict(event)]) == {'accepted': 1, 'duplicates': 0}
+
+    # Crash after the flush but before the journal was dropped. The first
+    # applied-keys check misses the key, so the guarded upsert must collide
+    drop_applied = writer._drop_applied
+    checks = []
+
+    def stale_first_check(groups, duplicates):
+        checks.append(groups)
+        return dict(groups) if len(checks) == 1 else drop_applied(groups, duplicates)
+
+    writer._drop_applied = stale_first_check
+    (tmp_path / 'intake-999999999.jsonl').write_text(json.dumps(event) + '\n')
+    buffer = IntakeWriteBuffer(lambda: writer, spill_dir=str(tmp_path))
+    buffer._recover()
+    assert buffer.flush() == {'accepted': 0, 'duplicates': 1}
+    assert len(checks) == 2
+
+    day = db.water_intake.find_one({'phone': '+15550001', 'date': _today()})
+    assert day['total_intake'] == 300
+    assert day['record_count'] == 1
+    assert _bucketed(db, '+15550001') == [300]